@@ -0,0 +1,172 @@
+"""
+Actor/learner self-play for TD training.
+
+TemporalDifferenceLearner.train and trainBatched generate games and take
+gradient steps in turn in one process, so only one core is ever busy. Here the
+games are played by a pool of actor processes instead, and the process that
+owns the TensorFlow session (the learner, see
+TemporalDifferenceLearner.trainParallel) only trains.
+
+Each actor runs a SelfPlayEnv on a NumPy copy of the network (TDInference),
+so actors never touch TensorFlow, and sends the positions it plays, with their
+TD targets (see self_play.tdExamples), to the learner over a bounded
+multiprocessing.Queue. The bound keeps actors from running arbitrarily far
+ahead of a learner that cannot keep up. The learner publishes its weights to
+SharedWeights, one flat float32 array in shared memory with a version number;
+actors check the version after every chunk of plies and copy the weights when
+it has changed, so they play with a network that is at most one sync interval
+(plus whatever is waiting in the queue) behind the learner's.
+
+Actors are started with spawn, not fork: by the time trainParallel starts
+them the learner holds a TensorFlow session, and a forked child would inherit
+its threads' locks in whatever state fork caught them, which can deadlock the
+child. A spawned actor starts a fresh interpreter that imports this module,
+with self_play and td_inference, to run actorLoop, and gets everything it
+shares with the learner (weights, queue, game count) as actorLoop's arguments.
+Like any spawned process it also imports the script that started it, as
+__mp_main__, so that script must keep its work under
+if __name__ == "__main__" (temporal_difference.py does). That import may load
+TensorFlow, but never creates a session.
+"""
+import multiprocessing
+import queue
+import time
+
+import numpy as np
+from multiprocessing.sharedctypes import RawArray, RawValue
+
+from self_play import SelfPlayEnv, tdExamples, explorationRate, gameResults
+from td_inference import TDInference, WEIGHT_NAMES
+
+
+class SharedWeights(object):
+    """
+    The TD network's weights in shared memory. publish writes a new set under
+    a lock and bumps the version; read copies the current set out under the
+    same lock, so a reader never sees half of an update.
+    """
+
+    def __init__(self, weights, lock=None):
+        self.shapes = [(name, np.shape(weights[name])) for name in WEIGHT_NAMES]
+        size = sum(int(np.prod(shape)) for name, shape in self.shapes)
+        self.values = RawArray('f', size)
+        self._version = RawValue('l', 0)
+        self.lock = lock or multiprocessing.Lock()
+        self.publish(weights)
+
+    @property
+    def version(self):
+        return self._version.value
+
+    def publish(self, weights):
+        flat = np.concatenate([np.asarray(weights[name], dtype=np.float32).reshape(-1)
+                               for name, shape in self.shapes])
+        with self.lock:
+            np.frombuffer(self.values, dtype=np.float32)[:] = flat
+            self._version.value += 1
+
+    def read(self):
+        """ Returns (version, weights by name) """
+        with self.lock:
+            version = self._version.value
+            flat = np.frombuffer(self.values, dtype=np.float32).copy()
+        weights = {}
+        offset = 0
+        for name, shape in self.shapes:
+            size = int(np.prod(shape))
+            weights[name] = flat[offset:offset + size].reshape(shape)
+            offset += size
+        return version, weights
+
+
+def actorLoop(sharedWeights, trajectories, gamesPlayed, stop, batchSize, chunkPlies, gamma,
+              height, width, seed):
+    """
+    Body of an actor process: plays batchSize games at a time with the latest
+    published weights, and every chunkPlies plies puts (inputs, targets,
+    results, weights version) on trajectories, results counting the games won
+    by "R" and "B" and drawn in the chunk. gamesPlayed is the shared count of
+    games finished by all actors, which sets epsilon and whether positions
+    before the end of a game are trained on yet, as in train. Runs until stop
+    is set.
+    """
+    env = SelfPlayEnv(batchSize, height, width, seed=seed)
+    version = None
+    while not stop.is_set():
+        if sharedWeights.version != version:
+            version, weights = sharedWeights.read()
+            network = TDInference(weights, height, width)
+        inputs, targets = [], []
+        results = {"R": 0, "B": 0, "Draw": 0}
+        for ply in range(chunkPlies):
+            played = gamesPlayed.value
+            plyInputs, plyTargets, winners, full = tdExamples(
+                env, network.forwardEvaluation, explorationRate(played), gamma, onlyEnded=(played <= 1000))
+            inputs.append(plyInputs)
+            targets.append(plyTargets)
+            for result, games in gameResults(winners, full).items():
+                results[result] += games
+        with gamesPlayed.get_lock():
+            gamesPlayed.value += sum(results.values())
+        chunk = (np.concatenate(inputs), np.concatenate(targets), results, version)
+        while not stop.is_set():
+            try:
+                trajectories.put(chunk, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+    # don't wait at exit for chunks the learner will never read
+    trajectories.cancel_join_thread()
+
+
+class ActorPool(object):
+    """
+    numActors actor processes playing self-play games with the weights given
+    and then with the ones published since. Use as a context manager, or call
+    start and stop.
+    """
+
+    def __init__(self, weights, numActors=4, batchSize=64, chunkPlies=8, gamma=0.995,
+                 height=6, width=7, gamesPlayed=0, queueSize=None, seed=None):
+        # never fork: the learner's TensorFlow session may already be running (see above)
+        self.context = multiprocessing.get_context("spawn")
+        self.weights = SharedWeights(weights, self.context.Lock())
+        self.trajectories = self.context.Queue(queueSize or 2 * numActors)
+        self.gamesPlayed = self.context.Value('l', gamesPlayed)
+        self.stopEvent = self.context.Event()
+        seeds = np.random.RandomState(seed).randint(0, 2 ** 31 - 1, size=numActors)
+        self.processes = [self.context.Process(
+            target=actorLoop,
+            args=(self.weights, self.trajectories, self.gamesPlayed, self.stopEvent, batchSize,
+                  chunkPlies, gamma, height, width, int(actorSeed))) for actorSeed in seeds]
+        for process in self.processes:
+            process.daemon = True
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        for process in self.processes:
+            process.start()
+
+    def publish(self, weights):
+        """ Makes weights the ones actors play with from their next chunk on """
+        self.weights.publish(weights)
+
+    def get(self, timeout=None):
+        """ The next chunk from any actor: (inputs, targets, results, weights version) """
+        return self.trajectories.get(timeout=timeout)
+
+    def stop(self, timeout=5.0):
+        self.stopEvent.set()
+        deadline = time.time() + timeout
+        # actors blocked on a full queue see the stop flag within their put timeout
+        for process in self.processes:
+            process.join(max(0.0, deadline - time.time()))
+            if process.is_alive():
+                process.terminate()
+                process.join()
@@ -1,8 +1,8 @@
 import sys
-import copy
+import time
 import board
-from minimax import Minimax
-from td_alpha_beta import TDAlphaBeta
+from minimax import Minimax, SearchTimeout
+from transposition import TranspositionTable
 
 class ConnectFourAgent(object):
     """
@@ -11,9 +11,13 @@ class ConnectFourAgent(object):
 
     The ConnectFourAgent uses the ConnectFourBoard to perform algorithms such as minimax and 
     alpha-beta pruning in order to choose its move. 
+
+    By default the search runs to a fixed depth. Given time_limit_ms, the minimax, alphabeta and
+    TDAlphaBeta algorithms instead deepen iteratively until the time runs out, and play the move
+    found by the deepest search that completed.
     """
 
-    def __init__(self, name="Computer", color=None, depth=3, algorithm="minimax", mcts_budget=1000, tdEvaluator=None, evalfn="simple"):
+    def __init__(self, name="Computer", color=None, depth=3, algorithm="minimax", mcts_budget=1000, tdEvaluator=None, evalfn="simple", tt_size_mb=16, time_limit_ms=None):
 
         self.name = name
         self.color = color
@@ -21,16 +25,24 @@ class ConnectFourAgent(object):
         self.algorithm = algorithm
         self.isHuman = False
         self.minimax_depth = depth
+        self.time_limit_ms = time_limit_ms
+        self.completed_depth = None  # depth reached by the last iterative deepening search
 
+        # memory cap for the search's transposition table
+        transpositionTable = TranspositionTable(sizeMB=tt_size_mb)
         if algorithm == "TDAlphaBeta":
-            self.tdAlphaBetaSolver = TDAlphaBeta(tdEvaluator)
+            # imported here so that the other algorithms start without numpy
+            from td_alpha_beta import TDAlphaBeta
+            self.tdAlphaBetaSolver = TDAlphaBeta(tdEvaluator, transpositionTable)
         else:
-            self.minimaxSolver = Minimax(evalfn)
+            self.minimaxSolver = Minimax(evalfn, transpositionTable)
         
     def setColor(self, color):
         self.color = color 
 
     def getMove(self, board=None):
+        if self.time_limit_ms is not None and self.algorithm in ("minimax", "alphabeta", "TDAlphaBeta"):
+            return self.iterativeDeepeningMove(board)
         if self.algorithm == "naive":
             return self.naiveMove(board)
         elif self.algorithm == "minimax":
@@ -61,16 +73,49 @@ class ConnectFourAgent(object):
             if board.isLegalMove(i): return i
 
     def minimaxMove(self, board):
-        return self.minimaxSolver.bestMove(self.minimax_depth, copy.deepcopy(board), self.color)
+        return self.minimaxSolver.bestMove(self.minimax_depth, board.clone(), self.color)
 
     def alphaBetaMove(self, board):
-        return self.minimaxSolver.bestMove(self.minimax_depth, copy.deepcopy(board), self.color, True)
+        return self.minimaxSolver.bestMove(self.minimax_depth, board.clone(), self.color, True)
 
     def expectimaxMove(self, board):
-        return self.minimaxSolver.bestMove(self.minimax_depth, board.getState2dArray(), self.color, True)
+        return self.minimaxSolver.bestMove(self.minimax_depth, board, self.color, True)
 
     def tdAlphaBetaMove(self, board):
-        return self.tdAlphaBetaSolver.bestMove(self.minimax_depth, copy.deepcopy(board), self.color)
+        return self.tdAlphaBetaSolver.bestMove(self.minimax_depth, board.clone(), self.color)
+
+    def searchToDepth(self, board, depth, deadline=None, first_move=None):
+        if self.algorithm == "TDAlphaBeta":
+            return self.tdAlphaBetaSolver.bestMove(depth, board, self.color, deadline, first_move)
+        alpha_beta = (self.algorithm == "alphabeta")
+        return self.minimaxSolver.bestMove(depth, board, self.color, alpha_beta, deadline, first_move)
+
+    def iterativeDeepeningMove(self, board):
+        """ Searches to depth 1, 2, 3, ... until time_limit_ms has elapsed, and plays the best
+            move of the last iteration that finished; one that runs past the deadline is abandoned.
+            Alpha-beta searches keep their transposition table and move orderer across
+            iterations, so each iteration starts from the table moves, killers and history of the
+            one before. Root moves are still each searched with a full window, so searching the
+            previous best move first prunes nothing at the root; it only fills the table and
+            the orderer from that move's subtree before the others. Plain minimax uses neither,
+            and its iterations search the root moves in board order.
+        """
+        deadline = time.time() + self.time_limit_ms / 1000.0
+        board = board.clone()
+        empty_squares = board.width * board.height - board.getNumMoves()
+        best_move = None
+        alpha_beta = self.algorithm in ("alphabeta", "TDAlphaBeta")
+        for depth in range(1, empty_squares + 1):
+            try:
+                # depth 1 is always allowed to finish, so there is always a move to play
+                best_move = self.searchToDepth(board, depth, deadline if depth > 1 else None,
+                                               best_move if alpha_beta else None)
+            except SearchTimeout:
+                break
+            self.completed_depth = depth
+            if time.time() >= deadline:
+                break
+        return best_move
 
     def getAction(self, board):
         pass 
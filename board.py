@@ -1,3 +1,17 @@
+import random
+
+zobristKeyTables = {}  # (height, width) -> Zobrist keys shared by every board of that size
+
+def getZobristKeys(height, width):
+	"""Returns (redKeys, blackKeys, blackToMoveKey): random 64-bit keys indexed by bitboard square."""
+	if (height, width) not in zobristKeyTables:
+		rng = random.Random(height * 1000 + width)  # fixed seed keeps hash keys reproducible across runs
+		numSquares = (height + 1) * width
+		redKeys = [rng.getrandbits(64) for square in range(numSquares)]
+		blackKeys = [rng.getrandbits(64) for square in range(numSquares)]
+		zobristKeyTables[(height, width)] = (redKeys, blackKeys, rng.getrandbits(64))
+	return zobristKeyTables[(height, width)]
+
 class ConnectFourBoard(object):
 	"""Encapsulates a connect four board.
 
@@ -9,6 +23,13 @@ class ConnectFourBoard(object):
 
 	For full generality, although the board implements ordinary connect 4 on a 6 x 7 board by default,
 	the board also supports more general games of connect K on an M x N board. 
+
+	Alongside the grid, the board keeps one bitboard (an integer) per color. Square (col, row) is bit
+	col * (self.height + 1) + row, so each column owns self.height + 1 bits: the extra sentinel bit at the
+	top of every column is never set, which keeps lines from wrapping from one column into the next.
+	Moves, legality checks and win detection are all done with a handful of shifts and masks on these integers.
+	The board also maintains a Zobrist hash of the position, updated with one XOR per move, for use as a
+	transposition table key.
 	"""
 
 	def __init__(self, boardHeight=6, boardWidth=7, connectK=4):
@@ -21,6 +42,29 @@ class ConnectFourBoard(object):
 		self.redString = "".join(["R"] * connectK)  # scan board for this pattern to see if red has won
 		self.blackString = "".join(["B"] * connectK)
 
+		self.columnStride = self.height + 1  # bits per column, including the sentinel
+		self.redBits = 0
+		self.blackBits = 0
+		# Shifts that move a square one step along a line: vertical, horizontal, and the two diagonals
+		self.lineShifts = (1, self.columnStride, self.columnStride + 1, self.columnStride - 1)
+		self.topSquareMasks = [1 << (col * self.columnStride + self.height - 1) for col in range(self.width)]
+		self.redKeys, self.blackKeys, self.blackToMoveKey = getZobristKeys(self.height, self.width)
+		self.hashKey = 0
+
+	def squareBit(self, columnNumber, rowNumber):
+		return 1 << (columnNumber * self.columnStride + rowNumber)
+
+	def hasKInARow(self, bits):
+		"""Checks a bitboard for K in a row along any line in O(log K) shifts per direction."""
+		for shift in self.lineShifts:
+			run, length = bits, 1  # bit i of run is set if a line of `length` pieces starts at square i
+			while length < self.connectK:
+				step = min(length, self.connectK - length)
+				run &= run >> (step * shift)
+				length += step
+			if run: return True
+		return False
+
 	def getRow(self, rowNumber):
 		assert(rowNumber >= 0 and rowNumber < self.height)
 		return [column[rowNumber] for column in self.columns]	
@@ -53,7 +97,7 @@ class ConnectFourBoard(object):
 	def isLegalMove(self, columnNumber):
 		"""Checks if a potential move is valid."""
 		if columnNumber < 0 or columnNumber >= self.width: return False  # column out of bounds
-		if self.columnFillHeights[columnNumber] == self.height:  return False  # column full 
+		if (self.redBits | self.blackBits) & self.topSquareMasks[columnNumber]: return False  # column full 
 		return True
 
 	def getLegalMoves(self):
@@ -62,7 +106,15 @@ class ConnectFourBoard(object):
 	def addPiece(self, columnNumber, color):
 		"""Adds piece of given color to given column if legal."""
 		if not self.isLegalMove(columnNumber): return False
-		self.columns[columnNumber][self.columnFillHeights[columnNumber]] = color
+		rowNumber = self.columnFillHeights[columnNumber]
+		square = columnNumber * self.columnStride + rowNumber
+		self.columns[columnNumber][rowNumber] = color
+		if color == "R":
+			self.redBits |= 1 << square
+			self.hashKey ^= self.redKeys[square]
+		else:
+			self.blackBits |= 1 << square
+			self.hashKey ^= self.blackKeys[square]
 		self.columnFillHeights[columnNumber] += 1
 		self.moves.append(columnNumber)
 		return True
@@ -76,10 +128,30 @@ class ConnectFourBoard(object):
 
 	def containsFourInARow(self):
 		"""Searches for four in row/column/diagonal R's or B's."""
-		lines = self.columns + self.getRows() + self.getDiagonals()
-		for line in lines:
-			winningColor = self.scan(line)
-			if winningColor is not None: return winningColor
+		if self.hasKInARow(self.redBits): return "R"
+		if self.hasKInARow(self.blackBits): return "B"
+		return None
+
+	def getLastMoveWinner(self):
+		"""Returns the color of the last piece played if it completed K in a row, otherwise None.
+
+		Any new win has to pass through the square that was just filled, so only the four lines
+		through that square are walked, at most K-1 squares in each direction.
+		"""
+		if len(self.moves) == 0: return None
+		lastColumn = self.moves[-1]
+		lastRow = self.columnFillHeights[lastColumn] - 1
+		color = self.columns[lastColumn][lastRow]
+		bits = self.redBits if color == "R" else self.blackBits
+		square = lastColumn * self.columnStride + lastRow
+		for shift in self.lineShifts:
+			lineLength = 1
+			for step in (shift, -shift):
+				position = square + step
+				while lineLength < self.connectK and position >= 0 and (bits >> position) & 1:
+					lineLength += 1
+					position += step
+			if lineLength >= self.connectK: return color
 		return None
 			
 	def display(self):
@@ -98,7 +170,32 @@ class ConnectFourBoard(object):
 		if len(self.moves) == 0: return 
 		prevColumn = self.moves.pop()  # remove move from self.moves
 		self.columnFillHeights[prevColumn] -= 1
-		self.columns[prevColumn][self.columnFillHeights[prevColumn]] = 'O'
+		prevRow = self.columnFillHeights[prevColumn]
+		square = prevColumn * self.columnStride + prevRow
+		if self.columns[prevColumn][prevRow] == "R":
+			self.redBits ^= 1 << square
+			self.hashKey ^= self.redKeys[square]
+		else:
+			self.blackBits ^= 1 << square
+			self.hashKey ^= self.blackKeys[square]
+		self.columns[prevColumn][prevRow] = 'O'
+
+	def clone(self):
+		"""Returns an independent copy of the board.
+
+		Only the grid, the fill heights and the move list are copied (the bitboards are plain integers),
+		which is far cheaper than copy.deepcopy.
+		"""
+		boardCopy = ConnectFourBoard.__new__(ConnectFourBoard)
+		boardCopy.__dict__.update(self.__dict__)
+		boardCopy.columns = [column[:] for column in self.columns]
+		boardCopy.columnFillHeights = self.columnFillHeights[:]
+		boardCopy.moves = self.moves[:]
+		return boardCopy
+
+	def getHashKey(self, colorToMove):
+		"""Zobrist key of the position together with the side to move."""
+		return self.hashKey if colorToMove == "R" else self.hashKey ^ self.blackToMoveKey
 
 	def getNumMoves(self):
 		return len(self.moves)
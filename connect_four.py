@@ -4,7 +4,6 @@ from optparse import OptionParser
 from board import ConnectFourBoard 
 from player import HumanPlayer, RandomPlayer, MctsPlayer, VelengPlayer
 from agent import ConnectFourAgent
-from td_alpha_beta import TDAlphaBeta 
 
 class ConnectFourGame(object):
     def __init__(self, firstPlayer, secondPlayer, boardHeight=6, boardWidth=7, mcts_enabled=False, mctsPlayer=None, mcts_budget=1000, silent=False):
@@ -31,7 +30,7 @@ class ConnectFourGame(object):
         return self.checkIfGameEnded()
 
     def checkIfGameEnded(self):
-        winner = self.board.containsFourInARow()
+        winner = self.board.getLastMoveWinner()
         if winner is not None:
             return winner
         if self.board.isFull():  # Draw
@@ -70,6 +69,7 @@ def simulate(numTrials, firstPlayer, secondPlayer, mctsPlayerToUpdate=None):
             BWin_tuple[0] += game.numMoves
             BWin_tuple[1] += 1
         if mctsPlayerToUpdate is not None:
+            # also shuts down its worker pool, so games don't leave processes behind
             mctsPlayerToUpdate.reset()
 
     print("Results after %d trials: %s" % (flags.numTrials, str(results)))
@@ -79,6 +79,14 @@ def simulate(numTrials, firstPlayer, secondPlayer, mctsPlayerToUpdate=None):
         print("Average moves in B wins (lower -> better): %.2f" % (float(BWin_tuple[0]) / float(BWin_tuple[1])))
 
 
+def parseBudget(budget):
+    """Reads a -b value: returns (iterations, time limit in ms), one of them None."""
+    if budget.endswith("ms"):
+        return None, float(budget[:-2])
+    if budget.endswith("s"):
+        return None, float(budget[:-1]) * 1000
+    return int(budget), None
+
 def getParserOptions():
     parser = OptionParser()
     parser.add_option("-f", action="store_true", dest="computerFirst")  # makes computer start instead of human
@@ -89,7 +97,9 @@ def getParserOptions():
 
     # MCTS flags
     parser.add_option("-m", action="store_true", dest="mctsEnabled")
-    parser.add_option("-b", type="int", dest="mctsBudget")
+    parser.add_option("-b", type="string", dest="mctsBudget")  # iterations per move, or a time per move such as 500ms or 2s
+    parser.add_option("--rollout", type="choice", choices=["uniform", "center", "heuristic"], dest="mctsRollout", default="uniform")
+    parser.add_option("--prior", type="choice", choices=["value0"], dest="mctsPrior")  # progressive bias from the value0 heuristic
 
     # Veleng flags
     parser.add_option("-v", action="store_true", dest="velengEnabled")
@@ -106,9 +116,10 @@ if __name__=="__main__":
 
     mctsPlayer = None
 
-    mcts_budget = 1000
+    mcts_budget, mcts_time_limit_ms = 1000, None
     if flags.mctsBudget is not None:
-        mcts_budget = flags.mctsBudget
+        mcts_budget, mcts_time_limit_ms = parseBudget(flags.mctsBudget)
+    mctsOptions = dict(budget=mcts_budget, time_limit_ms=mcts_time_limit_ms, rollout=flags.mctsRollout, prior=flags.mctsPrior)
 
     if flags.numTrials is None:
         # Human v. Computer
@@ -116,18 +127,20 @@ if __name__=="__main__":
         if flags.computerFirst:
             firstPlayer = ConnectFourAgent(name="Computer", color="R", algorithm=algorithm, depth=depth)
             if flags.mctsEnabled is not None:
-                firstPlayer = MctsPlayer(color="R", budget=mcts_budget)
+                firstPlayer = MctsPlayer(color="R", **mctsOptions)
             secondPlayer = HumanPlayer(name="Human")
             mctsPlayer = firstPlayer
         else:
             firstPlayer = HumanPlayer(name="Human")
             secondPlayer = ConnectFourAgent(name="Computer", color="B", algorithm=algorithm, depth=depth)
             if flags.mctsEnabled is not None:
-                secondPlayer = MctsPlayer(color="B", budget=mcts_budget)
+                secondPlayer = MctsPlayer(color="B", **mctsOptions)
             mctsPlayer = secondPlayer
 
         game = ConnectFourGame(firstPlayer=firstPlayer, secondPlayer=secondPlayer, mcts_enabled=flags.mctsEnabled, mctsPlayer=mctsPlayer)
         game.play(display=bool(flags.display))
+        if isinstance(mctsPlayer, MctsPlayer):
+            mctsPlayer.close()
             
     else:
         # Computer v. Computer for t trials
@@ -146,7 +159,7 @@ if __name__=="__main__":
         secondPlayer = None
         mctsPlayer = None
         if flags.mctsEnabled:
-            secondPlayer = MctsPlayer(color="B", budget=mcts_budget)
+            secondPlayer = MctsPlayer(color="B", **mctsOptions)
             mctsPlayer = secondPlayer
         elif flags.velengEnabled:
             secondPlayer = VelengPlayer(color="B")
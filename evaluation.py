@@ -0,0 +1,276 @@
+"""
+Bitboard evaluation for the Minimax engine.
+
+Minimax.value0 ("simple") and Minimax.value ("complex") score a position by
+counting streaks with checkForStreak and checkForSurroundedStreak, which walk
+every square of the 2D state in Python, once per feature. PatternEvaluator
+computes exactly the same features from the ConnectFourBoard bitboards: the
+test "a streak of length L starts on this square in this direction" becomes
+L-1 shifts and ANDs applied to every square at once, and counting the squares
+where it holds is a popcount. The lookup tables it needs (board and sentinel
+masks, column masks, line shifts) are precomputed once per board size, for
+any connect K on an M x N board.
+
+IncrementalEvaluator goes one step further for value0: instead of recomputing
+the counts at every leaf it updates them on each make/unmake of the search.
+"""
+
+try:
+    popcount = int.bit_count
+except AttributeError:  # Python < 3.10
+    def popcount(bits):
+        return bin(bits).count("1")
+
+# Column weights used by Minimax.centralityScore
+CENTRALITY_SCORES = [1, 3, 5, 9, 9, 5, 3, 1]
+
+patternEvaluators = {}  # (height, width, connectK) -> PatternEvaluator
+
+
+def getPatternEvaluator(height, width, connectK):
+    """Returns the shared PatternEvaluator for boards of the given shape."""
+    if (height, width, connectK) not in patternEvaluators:
+        patternEvaluators[(height, width, connectK)] = PatternEvaluator(height, width, connectK)
+    return patternEvaluators[(height, width, connectK)]
+
+
+def atLeast(bitboards, count):
+    """Bitboard of the squares set in at least 'count' of 'bitboards'."""
+    reached = [-1] + [0] * count  # reached[j]: squares set in at least j of the bitboards seen so far
+    for bits in bitboards:
+        for j in range(count, 0, -1):
+            reached[j] |= reached[j - 1] & bits
+    return reached[count]
+
+
+class PatternEvaluator(object):
+    """
+    Drop-in bitboard versions of Minimax.value0 and Minimax.value. Squares use
+    the ConnectFourBoard layout: square (col, row) is bit col * (height + 1) + row.
+    """
+
+    def __init__(self, height=6, width=7, connectK=4):
+        self.height = height
+        self.width = width
+        self.connectK = connectK
+        stride = height + 1
+        self.stride = stride
+        # Line directions in the order checkForStreak tries them: vertical, horizontal,
+        # diagonal up-right and diagonal down-right
+        self.shifts = (1, stride, stride + 1, stride - 1)
+        self.columnMasks = [((1 << height) - 1) << (col * stride) for col in range(width)]
+        self.boardMask = sum(self.columnMasks)
+        self.sentinelMask = sum(1 << (col * stride + height) for col in range(width))
+        if width <= len(CENTRALITY_SCORES):
+            self.centralityWeights = CENTRALITY_SCORES[:width]
+        else:
+            self.centralityWeights = [min(col, width - 1 - col) + 1 for col in range(width)]
+
+    def streaks(self, own, empty, length, numEmptyAllowed=0):
+        """ Same count as Minimax.checkForStreak: the number of (square, direction)
+            pairs where a streak of 'length' own pieces starts, allowing up to
+            numEmptyAllowed empty squares after the first. When empties are allowed,
+            a streak may also start on an empty square, and then consists of empties.
+        """
+        count = 0
+        for shift in self.shifts:
+            if numEmptyAllowed == 0:
+                starts = own
+                for k in range(1, length):
+                    starts &= own >> (k * shift)
+                count += popcount(starts)
+                continue
+            allowed = own | empty
+            starts = own
+            emptyRuns = empty
+            followingEmpties = []
+            for k in range(1, length):
+                starts &= allowed >> (k * shift)
+                emptyRuns &= empty >> (k * shift)
+                followingEmpties.append(empty >> (k * shift))
+            starts &= ~atLeast(followingEmpties, numEmptyAllowed + 1)
+            count += popcount(starts) + popcount(emptyRuns)
+        return count
+
+    def surroundedStreaks(self, empty, surround, surroundIsEmpty):
+        """ Same count as Minimax.checkForSurroundedStreak, which looks at runs of at
+            least three empty squares and the square where each run stops. Vertical and
+            horizontal runs only count when the surrounding color is empty (horizontal
+            ones twice); diagonal runs count when their stopping square, or for runs
+            that leave the top/bottom of the board the square beside their last one,
+            holds the surrounding color.
+        """
+        count = 0
+        if surroundIsEmpty:
+            vertical, horizontal = self.shifts[0], self.shifts[1]
+            count += popcount(empty & (empty >> vertical) & (empty >> (2 * vertical)))
+            count += 2 * popcount(empty & (empty >> horizontal) & (empty >> (2 * horizontal)))
+        # (shift, offset from the sentinel a run leaves the board through to the square it then checks)
+        for shift, offset in ((self.shifts[2], -1), (self.shifts[3], 1)):
+            runs = empty & (empty >> shift) & (empty >> (2 * shift))
+            length = 3
+            while runs:
+                longer = runs & (empty >> (length * shift))
+                exact = runs & ~longer
+                stops = (surround >> (length * shift)) | (
+                    (self.sentinelMask >> (length * shift)) & (surround >> (length * shift + offset)))
+                count += popcount(exact & stops)
+                runs = longer
+                length += 1
+        return count
+
+    def centrality(self, own):
+        """ Same as Minimax.centralityScore: the mean column weight of own pieces """
+        numPieces = popcount(own)
+        if numPieces == 0:
+            return 0.0
+        score = 0
+        for weight, mask in zip(self.centralityWeights, self.columnMasks):
+            score += weight * popcount(own & mask)
+        return (score + 0.0) / numPieces
+
+    def colorBits(self, board, color):
+        """ Returns (own, opponent, empty) bitboards from color's point of view """
+        if color == "R":
+            own, opp = board.redBits, board.blackBits
+        else:
+            own, opp = board.blackBits, board.redBits
+        return own, opp, self.boardMask & ~(own | opp)
+
+    def value0(self, board, color):
+        """ Bitboard version of Minimax.value0 (the "simple" evalfn) """
+        own, opp, _ = self.colorBits(board, color)
+        return self.value0Bits(own, opp)
+
+    def value0Bits(self, own, opp):
+        """ value0 for the side holding 'own', straight from the two bitboards """
+        empty = self.boardMask & ~(own | opp)
+        K = self.connectK
+        if self.streaks(opp, empty, K) > 0:
+            return -100000
+        return self.streaks(own, empty, K) * 100000 + self.streaks(own, empty, K - 1) * 100 + self.streaks(own, empty, K - 2)
+
+    def value(self, board, color):
+        """ Bitboard version of Minimax.value (the "complex" evalfn). Features are
+            summed in the same order with the same weights, so results are identical
+        """
+        own, opp, empty = self.colorBits(board, color)
+        K = self.connectK
+        if self.streaks(opp, empty, K) > 0:
+            return -100000
+        features = [
+            (self.streaks(own, empty, K), 100000.0),
+            (self.streaks(own, empty, K - 1), 5.0),
+            (self.streaks(own, empty, K - 2), 1.0),
+            (0, -100000.0),  # opponent K-streaks, known to be zero here
+            (self.streaks(opp, empty, K - 1), -5.0),
+            (self.streaks(opp, empty, K - 2), -1.0),
+
+            (self.streaks(own, empty, K, 1), 3.0),
+            (self.streaks(own, empty, K - 1, 1), 1.0),
+            (self.streaks(own, empty, K, 2), 1.0),
+            (self.streaks(opp, empty, K, 1), -3.0),
+            (self.streaks(opp, empty, K - 1, 1), -1.0),
+            (self.streaks(opp, empty, K, 2), -1.0),
+
+            (self.surroundedStreaks(empty, empty, True), 5.0),
+            (self.surroundedStreaks(empty, empty, True), -5.0),
+
+            (self.surroundedStreaks(empty, opp, False), 0.5),
+            (self.surroundedStreaks(empty, own, False), -0.5),
+
+            (self.centrality(own), 0.8),
+            (self.centrality(opp), 0.8),
+        ]
+        return sum([val[0] * val[1] for val in features])
+
+
+class IncrementalEvaluator(object):
+    """
+    Keeps the streak counts behind value0 up to date while a search makes and
+    undoes moves, so that evaluating a leaf is O(1).
+
+    A streak of length L through a square is one of at most 4 * L lines of L
+    squares containing it; their masks are precomputed per square for the
+    lengths value0 uses (K, K-1, K-2). Placing a piece can only complete lines
+    through its square, so pieceAdded tests just those masks against the mover's
+    bitboard, and the result only depends on the mover's pieces near that square,
+    so it is cached by (square, nearby pieces). The counts from before each move
+    are kept on a stack, which makes pieceRemoved a pop, and a K-streak count that
+    just went up tells the search the last move won without rescanning its lines.
+    """
+
+    def __init__(self, height=6, width=7, connectK=4):
+        self.height = height
+        self.width = width
+        self.connectK = connectK
+        self.stride = height + 1
+        self.lengths = (connectK, connectK - 1, connectK - 2)
+        self.linesThroughSquare = [[[] for length in self.lengths] for square in range(self.stride * width)]
+        for index, length in enumerate(self.lengths):
+            for col in range(width):
+                for row in range(height):
+                    for dcol, drow in ((0, 1), (1, 0), (1, 1), (1, -1)):
+                        squares = [(col + k * dcol, row + k * drow) for k in range(length)]
+                        if not all(0 <= c < width and 0 <= r < height for c, r in squares):
+                            continue
+                        mask = sum(1 << (c * self.stride + r) for c, r in squares)
+                        for c, r in squares:
+                            self.linesThroughSquare[c * self.stride + r][index].append(mask)
+        self.numSquares = self.stride * width
+        self.neighbourhoods = [0] * self.numSquares
+        for square in range(self.numSquares):
+            for masks in self.linesThroughSquare[square]:
+                for mask in masks:
+                    self.neighbourhoods[square] |= mask
+        self.deltas = {}  # (nearby mover pieces, square) -> count increases, see pieceAdded
+        self.maxDeltas = 1 << 16
+        self.redCounts = self.blackCounts = (0, 0, 0)
+        self.history = []
+
+    def reset(self, board):
+        """ Recomputes the counts for 'board' from scratch """
+        evaluator = getPatternEvaluator(self.height, self.width, self.connectK)
+        self.redCounts = tuple(evaluator.streaks(board.redBits, 0, length) for length in self.lengths)
+        self.blackCounts = tuple(evaluator.streaks(board.blackBits, 0, length) for length in self.lengths)
+        self.history = []
+
+    def pieceAdded(self, board):
+        """ Call right after board.addPiece """
+        col = board.moves[-1]
+        row = board.columnFillHeights[col] - 1
+        square = col * self.stride + row
+        isRed = board.columns[col][row] == "R"
+        bits = board.redBits if isRed else board.blackBits
+        key = (bits & self.neighbourhoods[square]) * self.numSquares + square
+        delta = self.deltas.get(key)
+        if delta is None:
+            if len(self.deltas) >= self.maxDeltas:
+                self.deltas.clear()
+            delta = tuple(sum(1 for mask in masks if bits & mask == mask) for masks in self.linesThroughSquare[square])
+            self.deltas[key] = delta
+        self.history.append((self.redCounts, self.blackCounts))
+        counts = self.redCounts if isRed else self.blackCounts
+        counts = (counts[0] + delta[0], counts[1] + delta[1], counts[2] + delta[2])
+        if isRed:
+            self.redCounts = counts
+        else:
+            self.blackCounts = counts
+
+    def pieceRemoved(self, board):
+        """ Call right after board.undoMove """
+        self.redCounts, self.blackCounts = self.history.pop()
+
+    def lastMoveWon(self, board):
+        """ Same as board.getLastMoveWinner() is not None, read off the counts """
+        if not self.history:
+            return board.getLastMoveWinner() is not None
+        red, black = self.history[-1]
+        return red[0] != self.redCounts[0] or black[0] != self.blackCounts[0]
+
+    def value0(self, color):
+        """ Equal to PatternEvaluator.value0 on the current board """
+        own, opp = (self.redCounts, self.blackCounts) if color == "R" else (self.blackCounts, self.redCounts)
+        if opp[0] > 0:
+            return -100000
+        return own[0] * 100000 + own[1] * 100 + own[2]
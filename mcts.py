@@ -2,10 +2,20 @@
 A collection of classes and functions for playing certain types of
 games. Specifically, an implementation of the MCTS algorithm.
 """
+import os
 import random
-from multiprocessing import Queue
-from math import sqrt, log
+import shutil
+import tempfile
+import time
+import multiprocessing
+from array import array
+from bisect import bisect_left
+from collections import deque, namedtuple
+from heapq import merge
+from multiprocessing.sharedctypes import RawArray, RawValue
+from math import sqrt, log, tanh
 from random import sample
+from evaluation import getPatternEvaluator
 
 class Game(object):
     """
@@ -26,6 +36,26 @@ class Game(object):
     def outcome(self, state, player):
         raise Exception('Method must be overridden.')
 
+    def initial_state(self):
+        raise Exception('Method must be overridden.')
+
+    def playout(self, state, player, perspective, n=1):
+        """
+        Plays n games from state to completion, with player to move, choosing
+        moves uniformly at random. Returns the sum of their outcomes for
+        perspective.
+        """
+        total = 0
+        for _ in range(n):
+            st = state
+            pl = player
+            while not self.terminal(st):
+                action = sample(self.actions(st), 1)[0]
+                st = self.result(st, action, pl)
+                pl = self.next_player(pl)
+            total += self.outcome(st, perspective)
+        return total
+
 
 class ConnectFour(Game):
     """
@@ -60,7 +90,7 @@ class ConnectFour(Game):
         self.target   = target
 
     def _legal(self, state, action):
-        if action not in xrange(len(state)):
+        if action not in range(len(state)):
             raise Exception('Invalid action: out of range')
         return len(state[action]) < self.height
 
@@ -113,6 +143,9 @@ class ConnectFour(Game):
             i -= 1
         return output
 
+    def initial_state(self):
+        return ((),) * self.width
+
     def actions(self, state):
         return tuple(
             [i for i, _ in enumerate(state) if self._legal(state, i)]
@@ -166,6 +199,343 @@ class ConnectFour(Game):
         return self.VALUE_DRAW
 
 
+class BitboardConnectFour(ConnectFour):
+    """
+    Connect Four with the same interface as ConnectFour, but with the board
+    stored as bitboards, which makes result(), terminal() and outcome() a few
+    integer operations instead of walks over nested tuples.
+
+    The state is a pair of ints (pieces of players[0], pieces of players[1]).
+    Slot (column, row) is bit column * (height + 1) + row; the extra bit on top
+    of each column is never set, so lines cannot wrap from one column into the
+    next. States are hashable and cheap to copy.
+
+    ( 0, 0 ) Empty board
+    """
+    def __init__(self, players=ConnectFour.PLAYERS, height=ConnectFour.HEIGHT,
+                 width=ConnectFour.WIDTH, target=ConnectFour.TARGET):
+        super(BitboardConnectFour, self).__init__(players, height, width, target)
+        stride = height + 1
+        self.stride = stride
+        # vertical, horizontal and the two diagonals
+        self.shifts = (1, stride, stride + 1, stride - 1)
+        # per direction, the shift amounts that turn "piece here" into "run of target starts here"
+        # by doubling the run length each step (1, 2, 4, ... capped at target)
+        self._runs = []
+        for shift in self.shifts:
+            amounts = []
+            length = 1
+            while length < target:
+                step = min(length, target - length)
+                amounts.append(step * shift)
+                length += step
+            self._runs.append(tuple(amounts))
+        # per direction, the shifts that line a slot up with each of the target - 1 slots after it
+        self._line_shifts = [tuple(i * shift for i in range(1, target)) for shift in self.shifts]
+        self.bottom = [1 << (column * stride) for column in range(width)]
+        self.top = [1 << (column * stride + height - 1) for column in range(width)]
+        self.column_masks = [((1 << height) - 1) << (column * stride) for column in range(width)]
+        self.full = sum(self.column_masks)
+        self.bottom_row = sum(self.bottom)
+        self.column_bits = (1 << stride) - 1
+        self.top_row = sum(self.top)
+        # actions only depend on which columns are full, so they are cached per top row
+        self._actions = {}
+        self._next_players = dict(zip(players, players[1:] + players[:1]))
+
+    def _legal(self, state, action):
+        if action not in range(self.width):
+            raise Exception('Invalid action: out of range')
+        return not (state[0] | state[1]) & self.top[action]
+
+    def _won(self, bits):
+        """Whether bits contain target slots in a row."""
+        for amounts in self._runs:
+            run = bits
+            for amount in amounts:
+                run &= run >> amount
+            if run:
+                return True
+        return False
+
+    def winning_slots(self, bits):
+        """
+        The slots not in bits that would complete target in a row for bits,
+        whether or not they can be played yet.
+        """
+        slots = 0
+        last = self.target - 1
+        for amounts in self._line_shifts:
+            # before[i] / after[i]: slots with i of bits right before / after them in this direction
+            before, after = [-1], [-1]
+            for amount in amounts:
+                before.append(before[-1] & (bits << amount))
+                after.append(after[-1] & (bits >> amount))
+            for i in range(self.target):
+                slots |= before[i] & after[last - i]
+        return slots & self.full & ~bits
+
+    def initial_state(self):
+        return (0, 0)
+
+    def key(self, state):
+        """
+        A single int that identifies state: players[0]'s pieces, plus a
+        marker bit on the first empty slot of each column. It fits in
+        (height + 1) * width bits.
+        """
+        return state[0] | ((state[0] | state[1]) + self.bottom_row)
+
+    def from_key(self, key):
+        """
+        The state identified by key (see key()).
+        """
+        mask = 0
+        for column in range(self.width):
+            # the marker is the highest bit set in the column
+            filled = ((key >> (column * self.stride)) & self.column_bits).bit_length() - 1
+            mask |= ((1 << filled) - 1) << (column * self.stride)
+        first = key & mask
+        return (first, mask ^ first)
+
+    def from_columns(self, state):
+        """Converts a ConnectFour state (tuple of column tuples) to a bitboard state."""
+        bits = [0, 0]
+        for column, pieces in enumerate(state):
+            for row, piece in enumerate(pieces):
+                bits[self.players.index(piece)] |= 1 << (column * self.stride + row)
+        return tuple(bits)
+
+    def pretty_state(self, state, escape=False):
+        columns = []
+        for column in range(self.width):
+            pieces = []
+            for row in range(self.height):
+                bit = 1 << (column * self.stride + row)
+                if state[0] & bit:
+                    pieces.append(self.players[0])
+                elif state[1] & bit:
+                    pieces.append(self.players[1])
+            columns.append(tuple(pieces))
+        return super(BitboardConnectFour, self).pretty_state(tuple(columns), escape)
+
+    def actions(self, state):
+        top = (state[0] | state[1]) & self.top_row
+        actions = self._actions.get(top)
+        if actions is None:
+            actions = tuple([i for i in range(self.width) if not top & self.top[i]])
+            self._actions[top] = actions
+        return actions
+
+    def result(self, state, action, player):
+        mask = state[0] | state[1]
+        if not 0 <= action < self.width:
+            raise Exception('Invalid action: out of range')
+        if mask & self.top[action]:
+            raise Exception('Illegal action')
+        # adding the column's bottom bit carries up to the lowest empty slot
+        move = (mask + self.bottom[action]) & self.column_masks[action]
+        if player == self.players[0]:
+            return (state[0] | move, state[1])
+        return (state[0], state[1] | move)
+
+    def terminal(self, state):
+        # All columns full means we are done
+        if (state[0] | state[1]) == self.full:
+            return True
+        # A winner also means we are done
+        return self._won(state[0]) or self._won(state[1])
+
+    def next_player(self, player):
+        try:
+            return self._next_players[player]
+        except KeyError:
+            raise Exception('Invalid player')
+
+    def playout(self, state, player, perspective, n=1):
+        """
+        Same as Game.playout, but without building a state per move: each game
+        is played on two scratch ints, the open columns are kept in a list that
+        shrinks as columns fill up, and after a move only the mover's pieces are
+        tested for a win.
+        """
+        if self.terminal(state):
+            return n * self.outcome(state, perspective)
+        first = self.players.index(player)
+        mine = self.players.index(perspective)
+        bottom, top, column_masks, runs = self.bottom, self.top, self.column_masks, self._runs
+        rand = random.random
+        total = 0
+        for _ in range(n):
+            bits = [state[0], state[1]]
+            mask = bits[0] | bits[1]
+            columns = [c for c in range(self.width) if not mask & top[c]]
+            mover = first
+            value = self.VALUE_DRAW
+            while columns:
+                i = int(rand() * len(columns))
+                column = columns[i]
+                move = (mask + bottom[column]) & column_masks[column]
+                mask |= move
+                own = bits[mover] | move
+                bits[mover] = own
+                if mask & top[column]:
+                    columns[i] = columns[-1]
+                    columns.pop()
+                for amounts in runs:
+                    run = own
+                    for amount in amounts:
+                        run &= run >> amount
+                    if run:
+                        break
+                else:
+                    mover ^= 1
+                    continue
+                value = self.VALUE_WIN if mover == mine else self.VALUE_LOSE
+                break
+            total += value
+        return total
+
+    def outcome(self, state, player):
+        for index, bits in enumerate(state):
+            if self._won(bits):
+                # A winner was found
+                if self.players[index] == player:
+                    return self.VALUE_WIN
+                else:
+                    return self.VALUE_LOSE
+        # No winner was found
+        return self.VALUE_DRAW
+
+
+class UniformRollout(object):
+    """
+    The default rollout policy: moves chosen uniformly at random, using the
+    game's own playout().
+    """
+    def playout(self, game, state, player, perspective, n=1):
+        return game.playout(state, player, perspective, n)
+
+
+class HeuristicRollout(object):
+    """
+    Rollout policy for BitboardConnectFour that plays less like a random
+    mover. With win_block, a player that can complete a line does (the game
+    ends there) and otherwise blocks the opponent's immediate win if there is
+    one; any other move is random, with column c weighted by
+    (1 + distance of c from the nearest edge) ** center_bias, so 0 is uniform.
+    Each move costs a few times more than a uniform one, in exchange for
+    outcomes that say more about the position.
+    """
+    def __init__(self, win_block=True, center_bias=1.0):
+        self.win_block = win_block
+        self.center_bias = center_bias
+        self._weights = {}
+
+    def column_weights(self, width):
+        weights = self._weights.get(width)
+        if weights is None:
+            weights = [(1 + min(c, width - 1 - c)) ** self.center_bias for c in range(width)]
+            self._weights[width] = weights
+        return weights
+
+    def playout(self, game, state, player, perspective, n=1):
+        if game.terminal(state):
+            return n * game.outcome(state, perspective)
+        first = game.players.index(player)
+        mine = game.players.index(perspective)
+        bottom, top, column_masks = game.bottom, game.top, game.column_masks
+        full, bottom_row, stride = game.full, game.bottom_row, game.stride
+        weights = self.column_weights(game.width)
+        win_block, winning_slots = self.win_block, game.winning_slots
+        rand = random.random
+        total = 0
+        for _ in range(n):
+            bits = [state[0], state[1]]
+            mask = bits[0] | bits[1]
+            columns = [c for c in range(game.width) if not mask & top[c]]
+            # a player's winning slots only change when that player moves
+            threats = [winning_slots(bits[0]), winning_slots(bits[1])] if win_block else None
+            mover = first
+            value = game.VALUE_DRAW
+            while columns:
+                move = 0
+                if win_block:
+                    playable = (mask + bottom_row) & full
+                    if threats[mover] & playable:
+                        value = game.VALUE_WIN if mover == mine else game.VALUE_LOSE
+                        break
+                    move = threats[mover ^ 1] & playable
+                    if move:
+                        # against two threats any one block loses the same way
+                        move &= -move
+                        column = (move.bit_length() - 1) // stride
+                if not move:
+                    r = 0.0
+                    for column in columns:
+                        r += weights[column]
+                    r *= rand()
+                    for column in columns:
+                        r -= weights[column]
+                        if r < 0:
+                            break
+                    move = (mask + bottom[column]) & column_masks[column]
+                mask |= move
+                bits[mover] |= move
+                if mask & top[column]:
+                    columns.remove(column)
+                # with win_block the move cannot have won: that was checked before it
+                if win_block:
+                    threats[mover] = winning_slots(bits[mover])
+                elif game._won(bits[mover]):
+                    value = game.VALUE_WIN if mover == mine else game.VALUE_LOSE
+                    break
+                mover ^= 1
+            total += value
+        return total
+
+
+class HeuristicPrior(object):
+    """
+    Prior for progressive bias (see Tree) on BitboardConnectFour states:
+    Minimax's value0 heuristic of the position after a move for the player who
+    made it, minus the same for the opponent, squashed into (-1, 1) by
+    tanh(difference / scale).
+    """
+    def __init__(self, scale=200.0):
+        self.scale = scale
+
+    def __call__(self, game, state, mover):
+        evaluator = getPatternEvaluator(game.height, game.width, game.target)
+        index = game.players.index(mover)
+        own, opp = state[index], state[1 - index]
+        difference = evaluator.value0Bits(own, opp) - evaluator.value0Bits(opp, own)
+        return tanh(difference / self.scale)
+
+
+class TDPrior(object):
+    """
+    Prior for progressive bias (see Tree) on BitboardConnectFour states: the
+    TD network's value of the position after a move, clipped to [-1, 1], for
+    the player who made it. players[0] is taken to be red, as in MctsPlayer.
+    weights are as returned by TemporalDifferenceLearner.getWeights, and
+    height and width must be those of the games searched, which the network
+    has one input per square of.
+    """
+    def __init__(self, weights, height=6, width=7):
+        # imported here so that plain MCTS does not load numpy
+        from td_alpha_beta import IncrementalTDEvaluator
+        inputs = len(weights["W1"])
+        if height * width != inputs:
+            raise ValueError('A %dx%d board does not fit a network with %d inputs' % (height, width, inputs))
+        self.evaluator = IncrementalTDEvaluator(weights, height, width)
+
+    def __call__(self, game, state, mover):
+        self.evaluator.resetBits(state[0], state[1])
+        value = max(-1.0, min(1.0, self.evaluator.evaluate()))
+        return value if mover == game.players[0] else -value
+
+
 class Node(object):
 
     COLORS = {
@@ -198,13 +568,12 @@ class Node(object):
         A generator function. Does a pre-order traversal over the nodes
         in the tree without using recursion.
         """
-        active = Queue.Queue()
-        active.put(self)
-        while active.qsize() > 0:
-            next = active.get()
+        active = deque([self])
+        while active:
+            next = active.popleft()
             for _, child in next.children.items():
                 if child is not None:
-                    active.put(child)
+                    active.append(child)
             yield next
 
     def __len__(self):
@@ -213,7 +582,7 @@ class Node(object):
         traversal, so it has O(n) running time.
         """
         n = 0
-        for node in self.traverse():
+        for node in self:
             n += 1
         return n
 
@@ -284,8 +653,8 @@ class Node(object):
         otherwise raises an exception) and returns it.
         """
         try:
-            action = self.children.keys()[self.children.values().index(None)]
-        except ValueError:
+            action = next(a for a, child in self.children.items() if child is None)
+        except StopIteration:
             raise Exception('Node is already fully expanded')
 
         state = self.game.result(self.state, action, self.player)
@@ -314,19 +683,13 @@ class Node(object):
         """
         return max(self.children.values(), key=lambda x: x.weight)
 
-    def simulation(self, player):
+    def simulation(self, player, n=1):
         """
-        Simulates the game to completion, choosing moves in a uniformly random
-        manner. The outcome of the simulation is returns as the state value for
-        the given player.
+        Simulates the game to completion n times, choosing moves in a uniformly
+        random manner. The summed outcome of the simulations is returned as the
+        state value for the given player.
         """
-        st = self.state
-        pl = self.player
-        while not self.game.terminal(st):
-            action = sample(self.game.actions(st), 1)[0]
-            st = self.game.result(st, action, pl)
-            pl = self.game.next_player(pl)
-        return self.game.outcome(st, player)
+        return self.game.playout(self.state, self.player, player, n)
         
     def dot_string(self, value=False, prettify=lambda x: x):
         """
@@ -358,128 +721,756 @@ class Node(object):
         return output
 
 
-def mcts_uct(game, state, player, budget):
+def robust_action(stats, game):
     """
-    Implementation of the UCT variant of the MCTS algorithm.
+    Picks the action to play from root statistics as returned by
+    Tree.root_stats(); see Tree.most_visited_action.
     """
-    root = Node(None, None, state, player, game)
-    while budget:
-        budget -= 1
-        # Tree Policy
-        child = root
-        while not child.terminal():
-            if not child.fully_expanded():
-                child = child.expand()
-                break
+    if not stats:
+        return None
+    for action, (_, _, proven) in stats.items():
+        if proven == game.VALUE_WIN:
+            return action
+    candidates = [action for action in stats if stats[action][2] != game.VALUE_LOSE] or list(stats)
+    return max(candidates, key=lambda action: stats[action][:2])
+
+
+class Tree(object):
+    """
+    Search tree for mcts_uct, stored as a struct of preallocated arrays indexed
+    by node number rather than as one Node object per position. A node keeps no
+    state, game or children dict; mcts_uct re-derives states from the root
+    along the selection path. Children form a linked list through first_child
+    and next_sibling, and are created in the order of game.actions(state), so
+    'expanded' (how many exist so far) says which action comes next.
+
+    Each node costs bytes_per_node() bytes (35 with the default array types),
+    against roughly 600 bytes for a Node. The arrays double when they run out of
+    room, so capacity is only a first guess; mcts_uct sizes it to the budget.
+    With max_nodes set the tree stops growing at that size, and later
+    iterations run their playouts from the leaves they reach instead.
+
+    subtree() re-roots the tree after a move, keeping the statistics gathered
+    below it, so a player can carry its search over from one turn to the next.
+
+    Values are kept from the point of view of the player who made the move
+    into the node, so every player picks the child that is best for itself.
+    This assumes two players with outcomes that sum to zero.
+
+    The tree is also an MCTS-Solver: 'proven' holds a node's exact game value
+    (from the same point of view) once it is known. Terminal nodes are proven
+    when first reached; a node is proven lost for the player who moved into it
+    as soon as one child is a proven win for the player to move, and proven at
+    the best child value once all its children are proven. Proven nodes are not
+    played out again and selection never enters a proven child, so the search
+    spends its iterations on the undecided part of the tree.
+
+    With a prior (a callable taking (game, state, mover) that rates the state
+    mover's move led to, in [-1, 1]) the tree uses progressive bias: a child's
+    search weight gets bias_weight * prior / (visits + 1) on top of UCT, which
+    steers the first visits towards moves the prior likes and fades as real
+    statistics come in. The prior is computed once, when the child is created.
+    """
+    NO_NODE = -1
+    UNPROVEN = 2
+
+    # (attribute, array typecode, initial value)
+    FIELDS = (
+        ('parent', 'i', -1),
+        ('first_child', 'i', -1),
+        ('next_sibling', 'i', -1),
+        ('action', 'h', -1),
+        ('expanded', 'h', 0),
+        ('num_actions', 'h', -1),   # -1 until the node's state is first checked
+        ('proven', 'b', UNPROVEN),
+        ('visits', 'i', 0),
+        ('value', 'd', 0.0),
+        ('bias', 'f', 0.0),         # the prior's rating, when there is a prior
+    )
+
+    def __init__(self, game, state, player, capacity=1024, max_nodes=None, prior=None, bias_weight=1.0):
+        self.game = game
+        self.state = state
+        self.player = player
+        self.prior = prior
+        self.bias_weight = bias_weight
+        self.max_nodes = max_nodes
+        if max_nodes is not None:
+            capacity = min(capacity, max_nodes)
+        self.capacity = max(1, capacity)
+        for name, typecode, initial in self.FIELDS:
+            setattr(self, name, array(typecode, [initial]) * self.capacity)
+        self.size = 1
+
+    def __len__(self):
+        return self.size
+
+    @classmethod
+    def bytes_per_node(cls):
+        """
+        Memory used per node, for sizing budgets.
+        """
+        return sum(array(typecode).itemsize for _, typecode, _ in cls.FIELDS)
+
+    def _grow(self):
+        extra = self.capacity
+        if self.max_nodes is not None:
+            extra = min(extra, self.max_nodes - self.capacity)
+        for name, typecode, initial in self.FIELDS:
+            getattr(self, name).extend(array(typecode, [initial]) * extra)
+        self.capacity += extra
+
+    def full(self):
+        return self.max_nodes is not None and self.size >= self.max_nodes
+
+    def add_child(self, parent, action):
+        """
+        Creates a child of parent reached by action and returns its index.
+        """
+        if self.size == self.capacity:
+            self._grow()
+        node = self.size
+        self.size += 1
+        self.parent[node] = parent
+        self.action[node] = action
+        self.next_sibling[node] = self.first_child[parent]
+        self.first_child[parent] = node
+        return node
+
+    def children(self, node):
+        child = self.first_child[node]
+        while child != self.NO_NODE:
+            yield child
+            child = self.next_sibling[child]
+
+    def weight(self, node):
+        if self.visits[node] == 0:
+            return 0
+        return self.value[node] / float(self.visits[node])
+
+    def best_child(self, node, c=1/sqrt(2)):
+        """
+        The unproven child with the highest UCT search weight (see
+        Node.search_weight) plus progressive bias, or NO_NODE if every child
+        is proven.
+        """
+        log_visits = log(self.visits[node]) if self.visits[node] else 0.0
+        visits, value, proven, bias = self.visits, self.value, self.proven, self.bias
+        bias_weight = self.bias_weight if self.prior is not None else 0.0
+        best, best_weight = self.NO_NODE, None
+        for child in self.children(node):
+            if proven[child] != self.UNPROVEN:
+                continue
+            n = visits[child]
+            if n == 0:
+                return child
+            weight = value[child] / n + c * sqrt(2 * log_visits / n)
+            if bias_weight:
+                weight += bias_weight * bias[child] / (n + 1)
+            if best_weight is None or weight > best_weight:
+                best, best_weight = child, weight
+        return best
+
+    def best_action(self, c=1/sqrt(2)):
+        """
+        Returns the action needed to reach the best child of the root.
+        """
+        return self.action[self.best_child(0, c)]
+
+    def expand(self, node, actions):
+        """
+        Adds the next unexpanded child of node, whose state has the given
+        actions, and returns it; NO_NODE if node is fully expanded or the
+        tree is full.
+        """
+        if self.expanded[node] >= len(actions) or self.full():
+            return self.NO_NODE
+        action = actions[self.expanded[node]]
+        self.expanded[node] += 1
+        return self.add_child(node, action)
+
+    def select(self, c=1/sqrt(2), virtual_loss=0):
+        """
+        Tree policy: walks down from the root through best children until it
+        reaches a terminal node or one with an unexpanded action, which is then
+        expanded. Returns (node, state, player to move, depth).
+        With virtual_loss, every node entered counts that many extra lost
+        visits until backup() is told to take them off again, which steers
+        concurrent searches of a shared tree apart.
+        """
+        game = self.game
+        node, state, player, depth = 0, self.state, self.player, 0
+        self._check(node, state, player)
+        while True:
+            if self.proven[node] != self.UNPROVEN:
+                return node, state, player, depth
+            child = self.expand(node, game.actions(state))
+            expanded = child != self.NO_NODE
+            if not expanded:
+                child = self.best_child(node, c)
+                if child == self.NO_NODE:
+                    # only when the tree is full
+                    return node, state, player, depth
+            if virtual_loss:
+                self.visits[child] += virtual_loss
+                self.value[child] -= virtual_loss
+            node = child
+            state = game.result(state, self.action[node], player)
+            if expanded and self.prior is not None:
+                self.bias[node] = self.prior(game, state, player)
+            player = game.next_player(player)
+            depth += 1
+            self._check(node, state, player)
+            if expanded:
+                return node, state, player, depth
+
+    def _check(self, node, state, player):
+        """
+        On a node's first visit, records its number of actions and, if it is
+        terminal, proves it.
+        """
+        if self.num_actions[node] != -1:
+            return
+        if self.game.terminal(state):
+            self.proven[node] = -self.game.outcome(state, player)
+            self.num_actions[node] = 0
+        else:
+            self.num_actions[node] = len(self.game.actions(state))
+
+    def simulate(self, node, state, player, depth, n=1, rollout=None):
+        """
+        Runs n playouts from a node returned by select(), with the given
+        rollout policy (the game's own playout() if None), and returns their
+        summed outcome for the root player. A proven node is not played out:
+        its exact value counts for every playout.
+        """
+        if self.proven[node] != self.UNPROVEN:
+            result = self.proven[node] * n
+            return result if depth % 2 == 1 else -result
+        if rollout is None:
+            return self.game.playout(state, player, self.player, n)
+        return rollout.playout(self.game, state, player, self.player, n)
+
+    def subtree(self, action):
+        """
+        Returns a new Tree rooted at the state action leads to from the root,
+        holding a compacted copy of that child's subtree (just a fresh root if
+        the child was never expanded). The rest of this tree is left behind.
+        """
+        state = self.game.result(self.state, action, self.player)
+        player = self.game.next_player(self.player)
+        child = self.NO_NODE
+        for node in self.children(0):
+            if self.action[node] == action:
+                child = node
+        if child == self.NO_NODE:
+            return Tree(self.game, state, player, max_nodes=self.max_nodes,
+                        prior=self.prior, bias_weight=self.bias_weight)
+        # breadth-first copy; 'order' lists old node numbers by new number
+        order = [child]
+        for node in order:
+            order.extend(self.children(node))
+        new_index = dict((old, new) for new, old in enumerate(order))
+        new_index[self.NO_NODE] = self.NO_NODE
+        tree = Tree(self.game, state, player, 1, self.max_nodes, self.prior, self.bias_weight)
+        for name, typecode, _ in self.FIELDS:
+            values = getattr(self, name)
+            setattr(tree, name, array(typecode, [values[node] for node in order]))
+        for name in ('parent', 'first_child', 'next_sibling'):
+            links = getattr(tree, name)
+            for node in range(len(order)):
+                links[node] = new_index.get(links[node], self.NO_NODE)
+        tree.parent[0] = tree.next_sibling[0] = self.NO_NODE
+        tree.size = tree.capacity = len(order)
+        return tree
+
+    def backup(self, node, delta, depth, n=1, virtual_loss=0):
+        """
+        Adds n visits and delta, a summed outcome for the root player, to node
+        and its ancestors, negating delta for nodes the other player moved into.
+        virtual_loss must match the select() call that returned node.
+        """
+        leaf = node
+        value = delta if depth % 2 == 1 else -delta
+        while node != self.NO_NODE:
+            parent = self.parent[node]
+            if parent == self.NO_NODE:
+                self.visits[node] += n
+                self.value[node] += value
             else:
-                child = child.best_child()
-        # Default Policy
-        delta = child.simulation(player)
-        # Backup
-        while not child is None:
-            child.visits += 1
-            child.value += delta
-            child = child.parent
+                self.visits[node] += n - virtual_loss
+                self.value[node] += value + virtual_loss
+            value = -value
+            node = parent
+        self._propagate_proof(leaf)
+
+    def _propagate_proof(self, node):
+        """
+        Proves the ancestors of a newly proven node that its proof settles.
+        """
+        win, lose = self.game.VALUE_WIN, self.game.VALUE_LOSE
+        while self.proven[node] != self.UNPROVEN:
+            parent = self.parent[node]
+            if parent == self.NO_NODE or self.proven[parent] != self.UNPROVEN:
+                return
+            if self.proven[node] == win:
+                # the player to move at parent has a winning move
+                self.proven[parent] = lose
+            else:
+                if self.expanded[parent] < self.num_actions[parent]:
+                    return
+                values = [self.proven[child] for child in self.children(parent)]
+                if self.UNPROVEN in values:
+                    return
+                self.proven[parent] = -max(values)
+            node = parent
+
+    def most_visited_action(self):
+        """
+        The root action to play: a proven win if there is one, otherwise the
+        child with the most visits (ties go to the higher total value) among
+        those not proven lost. None if the root has no children yet.
+        """
+        return robust_action(self.root_stats(), self.game)
 
-    return root.best_action(c=0)
+    def root_stats(self):
+        """
+        Maps each expanded root action to (visits, total value, proven value)
+        of its child.
+        """
+        return dict((self.action[node], (self.visits[node], self.value[node], self.proven[node]))
+                    for node in self.children(0))
 
 
-def full_tree(game, state, player):
+class SharedTree(Tree):
     """
-    Creates a full game tree in which player moves first. The traversal is done
-    in breadth-first order. The return value is the root node.
+    A Tree in shared memory, for tree-parallel search by several processes at
+    once. Its capacity is fixed when it is created. Adding children is done
+    under a lock, so the tree structure stays consistent; visit and value
+    updates are not locked, and the occasional lost update between two
+    processes is accepted in exchange for not serialising the searches.
     """
-    active = Queue.Queue()
-    root = Node(None, None, state, player)
-    active.put(root)
-    
-    current = None
-    while active.qsize() > 0:
-        current = active.get()
-        # Assign value if this is a terminal node
-        if game.terminal(current.state):
-            continue
-        # Explore children otherwise
-        for action in game.actions(current.state):
-            nstate = game.result(current.state, action, current.player)
-            nplayer = game.next_player(current.player)
-            node = Node(current, action, nstate, nplayer)
-            current.children[action] = node
-            active.put(node)
-    return root
-
-
-def minimax(game, state, player):
-    """
-    Applies the Minimax algorithm to the given game. Returns the
-    root node with values assigned to each node in the game tree.
-    """
-    active = []
-    
-    root = full_tree(game, state, player)
-    for node in root:
-        active.append(node)
-    
-    current = None
-    while active:
-        current = active.pop()
-        # Leaf (terminal) node
-        if game.terminal(current.state):
-            current.value = game.outcome(current.state, player)
-            continue
-        # Interior or root node
-        values = tuple([i.value for i in current.children.values()])
-        if current.player == player:
-            current.value = max(values)
+
+    def __init__(self, game, state, player, capacity, prior=None, bias_weight=1.0):
+        self._size = RawValue('i', 0)
+        self.lock = multiprocessing.Lock()
+        self.game = game
+        self.state = state
+        self.player = player
+        self.prior = prior
+        self.bias_weight = bias_weight
+        self.capacity = self.max_nodes = max(1, capacity)
+        for name, typecode, initial in self.FIELDS:
+            values = RawArray(typecode, self.capacity)
+            if initial:
+                values[:] = [initial] * self.capacity
+            setattr(self, name, values)
+        self.size = 1
+
+    @property
+    def size(self):
+        return self._size.value
+
+    @size.setter
+    def size(self, value):
+        self._size.value = value
+
+    def expand(self, node, actions):
+        with self.lock:
+            return Tree.expand(self, node, actions)
+
+
+class MctsSearch(object):
+    """
+    Anytime UCT search. run() searches for an iteration budget, a wall-clock
+    time limit or both, and can be called again to keep going; best_action()
+    can be asked at any point. The action played is the most visited root
+    child, which allows stopping early: once the leading child is more visits
+    ahead of the runner-up than the remaining budget could add, no further
+    search can change the choice.
+
+    rollout is the rollout policy (see UniformRollout and HeuristicRollout);
+    prior and bias_weight set up progressive bias in a new tree (see Tree).
+    """
+
+    def __init__(self, game, state, player, playouts=1, tree=None, capacity=1024, max_nodes=None,
+                 rollout=None, prior=None, bias_weight=1.0):
+        if tree is None:
+            tree = Tree(game, state, player, capacity, max_nodes, prior, bias_weight)
+        elif tree.state != state or tree.player != player:
+            raise Exception('Tree is not rooted at the given state')
+        self.game = game
+        self.player = player
+        self.playouts = playouts
+        self.rollout = rollout
+        self.tree = tree
+        self.iterations = 0
+        self.seconds = 0.0
+        self.stopped_early = False
+
+    def iterate(self, n=1):
+        """
+        Runs n UCT iterations, each adding one node to the tree.
+        """
+        tree, playouts, rollout = self.tree, self.playouts, self.rollout
+        for _ in range(n):
+            # Tree Policy
+            node, st, pl, depth = tree.select()
+            # Default Policy
+            delta = tree.simulate(node, st, pl, depth, playouts, rollout)
+            # Backup
+            tree.backup(node, delta, depth, playouts)
+        self.iterations += n
+
+    def best_action(self):
+        """
+        The action the search would play now.
+        """
+        return self.tree.most_visited_action()
+
+    def decided(self, remaining):
+        """
+        Whether remaining more iterations could not change best_action().
+        """
+        if self.tree.proven[0] != self.tree.UNPROVEN:
+            return True
+        stats = self.tree.root_stats()
+        if any(proven == self.game.VALUE_WIN for _, _, proven in stats.values()):
+            return True
+        # an unexpanded move could still turn out best
+        if len(stats) < len(self.game.actions(self.tree.state)):
+            return False
+        visits = sorted([visits for visits, _, proven in stats.values()
+                         if proven != self.game.VALUE_LOSE], reverse=True)
+        if not visits:
+            return False
+        if len(visits) == 1:
+            return True
+        return visits[0] - visits[1] > remaining * self.playouts
+
+    def run(self, budget=None, time_limit=None, early_stop=True):
+        """
+        Searches for up to budget iterations and/or time_limit seconds
+        (whichever runs out first) and returns best_action().
+        """
+        if budget is None and time_limit is None:
+            raise Exception('No budget or time limit given')
+        start = time.time()
+        deadline = None if time_limit is None else start + time_limit
+        done = 0
+        while budget is None or done < budget:
+            if deadline is not None and time.time() >= deadline:
+                break
+            self.iterate()
+            done += 1
+            if early_stop:
+                remaining = float('inf') if budget is None else budget - done
+                if deadline is not None:
+                    now = time.time()
+                    # iterations still expected before the deadline at the rate so far
+                    remaining = min(remaining, done * (deadline - now) / max(now - start, 1e-9))
+                if self.decided(remaining):
+                    self.stopped_early = True
+                    break
+        self.seconds += time.time() - start
+        return self.best_action()
+
+    def stats(self):
+        """
+        Summary of the search so far.
+        """
+        playouts = self.iterations * self.playouts
+        return {
+            'iterations': self.iterations,
+            'playouts': playouts,
+            'seconds': self.seconds,
+            'playouts_per_second': playouts / self.seconds if self.seconds > 0 else 0.0,
+            'tree_size': len(self.tree),
+            'tree_bytes': len(self.tree) * self.tree.bytes_per_node(),
+            'stopped_early': self.stopped_early,
+            'best_action': self.best_action(),
+        }
+
+
+def mcts_uct(game, state, player, budget, playouts=1, tree=None, time_limit=None, early_stop=False,
+             rollout=None, prior=None, bias_weight=1.0):
+    """
+    Implementation of the UCT variant of the MCTS algorithm. Each of the budget
+    iterations adds one node and runs playouts simulations from it (or uses its
+    exact value, once it is proven, see Tree); with
+    time_limit (seconds) the search also stops when the time is up, and budget
+    may then be None. early_stop ends the search once the result is decided
+    (see MctsSearch).
+    If tree is given (a Tree rooted at state, with player to move) the search
+    continues in it, building on the statistics it already holds.
+    rollout, prior and bias_weight are as for MctsSearch.
+    """
+    capacity = budget + 1 if budget is not None else 1024
+    search = MctsSearch(game, state, player, playouts, tree, capacity,
+                        rollout=rollout, prior=prior, bias_weight=bias_weight)
+    return search.run(budget, time_limit, early_stop)
+
+
+def _root_parallel_worker(args):
+    game, state, player, budget, playouts, time_limit, seed, rollout, prior, bias_weight = args
+    random.seed(seed)
+    search = MctsSearch(game, state, player, playouts, rollout=rollout, prior=prior, bias_weight=bias_weight)
+    search.run(budget, time_limit, early_stop=False)
+    return search.tree.root_stats()
+
+
+def _tree_parallel_worker(tree, player, iterations, playouts, virtual_loss, seed, deadline=None, rollout=None):
+    random.seed(seed)
+    while deadline is None or time.time() < deadline:
+        with iterations.get_lock():
+            if iterations.value <= 0:
+                break
+            iterations.value -= 1
+        node, st, pl, depth = tree.select(virtual_loss=virtual_loss)
+        delta = tree.simulate(node, st, pl, depth, playouts, rollout)
+        tree.backup(node, delta, depth, playouts, virtual_loss)
+
+
+def mcts_uct_parallel(game, state, player, budget, workers, mode='root', playouts=1,
+                      virtual_loss=1, pool=None, time_limit=None, rollout=None, prior=None, bias_weight=1.0):
+    """
+    mcts_uct spread over worker processes. budget is per worker, so for the
+    same wall-clock time the number of playouts grows with the worker count.
+    With time_limit (seconds) the workers also stop when the time is up; in
+    'root' mode budget may then be None, in 'tree' mode it sizes the shared
+    tree and must be given.
+
+    'root' runs an independent search in each worker (in pool, a
+    multiprocessing.Pool, if given) and plays the action whose root child got
+    the most visits summed over all the trees.
+    'tree' has the workers share one SharedTree, using virtual loss so they
+    tend to explore different lines, and plays its best action as mcts_uct does.
+    rollout, prior and bias_weight are as for MctsSearch.
+    """
+    seeds = [random.getrandbits(32) for _ in range(workers)]
+    if mode == 'root':
+        jobs = [(game, state, player, budget, playouts, time_limit, seed, rollout, prior, bias_weight)
+                for seed in seeds]
+        if pool is None:
+            worker_pool = multiprocessing.Pool(workers)
+            try:
+                results = worker_pool.map(_root_parallel_worker, jobs)
+            finally:
+                worker_pool.close()
+                worker_pool.join()
         else:
-            current.value = min(values)
-    
-    return root
+            results = pool.map(_root_parallel_worker, jobs)
+        merged = {}
+        for stats in results:
+            for action, (visits, value, proven) in stats.items():
+                total_visits, total_value, merged_proven = merged.get(action, (0, 0.0, Tree.UNPROVEN))
+                if proven != Tree.UNPROVEN:
+                    merged_proven = proven
+                merged[action] = (total_visits + visits, total_value + value, merged_proven)
+        return robust_action(merged, game)
+    elif mode == 'tree':
+        if budget is None:
+            raise Exception('Tree-parallel search needs an iteration budget')
+        tree = SharedTree(game, state, player, budget * workers + 1, prior, bias_weight)
+        iterations = multiprocessing.Value('i', budget * workers)
+        deadline = None if time_limit is None else time.time() + time_limit
+        processes = [multiprocessing.Process(
+            target=_tree_parallel_worker,
+            args=(tree, player, iterations, playouts, virtual_loss, seed, deadline, rollout)) for seed in seeds]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        return tree.most_visited_action()
+    raise Exception('Unknown parallel mode: %s' % mode)
+
 
+Solution = namedtuple('Solution', ['value', 'action_values', 'positions'])
 
-def mcts(game, state, player, n):
+
+def solve(game, state, player, workdir=None, chunk_keys=1 << 18):
     """
-    Implementation of the UCT variant of the Monte Carlo Tree Search algorithm.
+    Exact value of state for player, who is to move, found by exhaustive
+    search. Meant for small boards: the 4x4 connect-3 default, and up to 5x5
+    or 5x6 variants given time.
+
+    The game tree is walked as a DAG of distinct positions, one layer per
+    number of pieces. A layer is kept as a sorted array of position keys
+    (BitboardConnectFour.key, 8 bytes each), which removes transpositions.
+    The forward pass builds each layer from the previous one, which it reads
+    back from its file in workdir (a temporary directory by default), with an
+    external merge sort: the children are collected chunk_keys at a time,
+    each chunk is sorted, deduplicated and written out as a run, and the runs
+    are merged into the next layer's file. Building a layer thus holds one
+    chunk in memory, however large the layer. The backward pass then scores
+    the layers from the last to the first, reading them back one at a time,
+    so at most two layers (8 bytes per position) and their values (1 byte)
+    are in memory at once.
+
+    Returns Solution(value, action_values, positions): the value for player,
+    the value for player of each legal action, and the number of distinct
+    positions reachable from state (state included).
     """
-    root = Node(None, None, state, player)
-    unexplored = Queue.Queue()
-    unexplored.put(root)
+    if not isinstance(game, BitboardConnectFour):
+        # tuple-state ConnectFour
+        game = BitboardConnectFour(game.players, game.height, game.width, game.target)
+        state = game.from_columns(state)
+    first = player == game.players[0]
+    own_dir = workdir is None
+    if own_dir:
+        workdir = tempfile.mkdtemp(prefix='connect-four-solve-')
+    try:
+        num_layers = _solve_forward(game, state, first, workdir, chunk_keys)
+        value, child_keys, child_values = _solve_backward(game, first, num_layers, workdir)
+        positions = sum(os.path.getsize(_layer_path(workdir, ply)) // 8 for ply in range(num_layers))
+    finally:
+        if own_dir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    action_values = {}
+    if not game.terminal(state):
+        for action in game.actions(state):
+            child = game.key(game.result(state, action, player))
+            action_values[action] = -child_values[bisect_left(child_keys, child)]
+    return Solution(value, action_values, positions)
+
 
-    for _ in xrange(n):
-        # Quit early if we are out of nodes
-        if unexplored.qsize() == 0:
-            break
-        # Add the new node to the tree
-        current = unexplored.get()
-        if current.parent is not None:
-            current.parent.children[current.action] = current
-        # Add the newly discovered nodes to the queue
-        for action in game.actions(current.state):
-            nstate = game.result(current.state, action, current.player)
-            nplayer = game.next_player(current.player)
-            node = Node(current, action, nstate, nplayer)
-            unexplored.put(node)
-        # Simulate the rest of the game from the current node
-        cstate = current.state
-        cplayer = current.player
-        while not game.terminal(cstate):
-            caction = random.choice(game.actions(cstate))
-            cstate = game.result(cstate, caction, cplayer)
-            cplayer = game.next_player(cplayer)
-        simvalue = game.outcome(cstate, player)
-        # Back simulation value up to the root
-        backup = current
-        while backup is not None:
-            backup.value += simvalue
-            backup.visits += 1
-            backup = backup.parent
+def _layer_path(workdir, ply):
+    return os.path.join(workdir, 'layer-%03d' % ply)
 
-    return root
+
+def _children(game, state, first_to_move):
+    """
+    Keys of the positions one move after state.
+    """
+    mask = state[0] | state[1]
+    for column in game.actions(state):
+        move = (mask + game.bottom[column]) & game.column_masks[column]
+        own = state[0] | move if first_to_move else state[0]
+        yield own | ((mask | move) + game.bottom_row)
 
 
+def _solve_forward(game, state, first, workdir, chunk_keys):
+    """
+    Writes the sorted keys of every layer to workdir and returns the number
+    of layers.
+    """
+    with open(_layer_path(workdir, 0), 'wb') as f:
+        array('Q', [game.key(state)]).tofile(f)
+    ply = 0
+    while True:
+        first_to_move = first == (ply % 2 == 0)
+        runs = []
+        chunk = array('Q')
+        for key in _iter_layer(_layer_path(workdir, ply), chunk_keys):
+            position = game.from_key(key)
+            if game.terminal(position):
+                continue
+            chunk.extend(_children(game, position, first_to_move))
+            if len(chunk) >= chunk_keys:
+                runs.append(_write_run(workdir, len(runs), chunk))
+                chunk = array('Q')
+        if chunk:
+            runs.append(_write_run(workdir, len(runs), chunk))
+        ply += 1
+        count = _merge_runs(runs, _layer_path(workdir, ply), chunk_keys)
+        if count == 0:
+            os.remove(_layer_path(workdir, ply))
+            return ply
 
 
+def _write_run(workdir, index, keys):
+    """
+    Writes keys, sorted and without duplicates, to a run file and returns its path.
+    """
+    run = array('Q')
+    last = None
+    for key in sorted(keys):
+        if key != last:
+            run.append(key)
+            last = key
+    path = os.path.join(workdir, 'run-%05d' % index)
+    with open(path, 'wb') as f:
+        run.tofile(f)
+    return path
 
 
+def _merge_runs(runs, path, chunk_keys):
+    """
+    Merges the sorted run files into one sorted file at path without
+    duplicates, deleting the runs. Returns the number of keys written.
+    """
+    count = 0
+    last = None
+    out = array('Q')
+    with open(path, 'wb') as f:
+        for key in merge(*[_iter_layer(run, chunk_keys) for run in runs]):
+            if key != last:
+                out.append(key)
+                last = key
+                if len(out) >= chunk_keys:
+                    out.tofile(f)
+                    count += len(out)
+                    out = array('Q')
+        out.tofile(f)
+        count += len(out)
+    for run in runs:
+        os.remove(run)
+    return count
 
 
+def _iter_layer(path, chunk_keys):
+    """
+    The keys in a layer or run file, read chunk_keys at a time.
+    """
+    with open(path, 'rb') as f:
+        while True:
+            keys = array('Q')
+            try:
+                keys.fromfile(f, chunk_keys)
+            except EOFError:  # the last, partial chunk is still read
+                pass
+            for key in keys:
+                yield key
+            if len(keys) < chunk_keys:
+                return
+
+
+def _solve_backward(game, first, num_layers, workdir):
+    """
+    Scores the layers last to first, each for its player to move. Returns the
+    value of the single position in layer 0, and the keys and values of
+    layer 1.
+    """
+    next_keys, next_values = array('Q'), array('b')
+    for ply in range(num_layers - 1, 0, -1):
+        keys = _read_layer(workdir, ply)
+        first_to_move = first == (ply % 2 == 0)
+        values = array('b', bytes(len(keys)))
+        for index, key in enumerate(keys):
+            values[index] = _score(game, game.from_key(key), first_to_move, next_keys, next_values)
+        next_keys, next_values = keys, values
+    return _score(game, game.from_key(_read_layer(workdir, 0)[0]), first, next_keys, next_values), next_keys, next_values
+
+
+def _read_layer(workdir, ply):
+    keys = array('Q')
+    with open(_layer_path(workdir, ply), 'rb') as f:
+        keys.frombytes(f.read())
+    return keys
+
+
+def _score(game, position, first_to_move, next_keys, next_values):
+    """
+    Value of position for its player to move, given the sorted keys and
+    values of the layer after it.
+    """
+    if game.terminal(position):
+        return game.outcome(position, game.players[0] if first_to_move else game.players[1])
+    best = game.VALUE_LOSE
+    for child in _children(game, position, first_to_move):
+        value = -next_values[bisect_left(next_keys, child)]
+        if value > best:
+            best = value
+            if best == game.VALUE_WIN:
+                break
+    return best
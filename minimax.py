@@ -2,42 +2,48 @@
 __author__ = 'catherinaxu'
 
 import board
+from transposition import TranspositionTable, EXACT, boundType
+from move_ordering import MoveOrderer
+from evaluation import getPatternEvaluator, IncrementalEvaluator
 
-import random, sys
+import random, sys, time
 
 neg_inf = float('-inf')
 inf = float('inf')
 
+# Width of the scout window in principal variation search. Any positive width
+# gives exact results; 1 suits the integer-valued "simple" evaluation.
+NULL_WINDOW = 1
+
+class SearchTimeout(Exception):
+    """ Raised inside a search once its deadline has passed """
+    pass
+
 class Minimax(object):
     """ Minimax object that takes a current connect four board state
     """
     color = None
 
-    def __init__(self, evalfn):
+    def __init__(self, evalfn, transpositionTable=None, moveOrderer=None, incremental=True):
         # copy the board to self.board
         self.evalfn = evalfn
-        pass
-
-    def bestMove(self, depth, board, curr_player, alpha_beta=False):
+        # keeps the "simple" evaluation up to date through make/unmake (None: evaluate leaves from scratch)
+        self.incremental = None
+        if incremental and evalfn == "simple":
+            self.incremental = IncrementalEvaluator()
+        # remembers alpha-beta results across move orders (and across moves of a game)
+        self.transpositionTable = transpositionTable if transpositionTable is not None else TranspositionTable()
+        # decides the order alpha-beta visits children in
+        self.moveOrderer = moveOrderer if moveOrderer is not None else MoveOrderer()
+        self.deadline = None  # time.time() value after which a search raises SearchTimeout
+        self.nodes = 0  # nodes visited by the last bestMove call
+        self.root_num_moves = 0
+
+    def bestMove(self, depth, board, curr_player, alpha_beta=False, deadline=None, first_move=None):
         """ Returns the best move (as a column number) and the associated alpha
-            Calls search()
+            Calls moveValues() and breaks ties at random
         """
-        state = board.getState2dArray()
-
-        # determine opponent's color
-        opp_player = "B" if curr_player == "R" else "R"
-
-        # enumerate all legal moves
-        legal_moves = {} # will map legal move states to their alpha values
-        for col in range(7):
-            # if column i is a legal move...
-            if self.isLegalMove(col, state):
-                # make the move in column 'col' for curr_player
-                temp = self.makeMove(state, col, curr_player)
-                if alpha_beta:
-                    legal_moves[col] = -self.search_alpha_beta(depth-1, temp, opp_player, neg_inf, inf, False)
-                else:
-                    legal_moves[col] = -self.search(depth-1, temp, opp_player)
+        legal_moves = self.moveValues(depth, board, curr_player, alpha_beta, deadline, first_move)
         best_alpha = neg_inf
         best_move = None
         moves = list(legal_moves.items())
@@ -48,122 +54,164 @@ class Minimax(object):
                 best_move = move
         return best_move
 
-    def search(self, depth, state, curr_player):
+    def moveValues(self, depth, board, curr_player, alpha_beta=False, deadline=None, first_move=None):
+        """ Returns a dict mapping each legal move to its value for curr_player
+            Each root move is searched with a full window, so with alpha_beta the
+            values are the same as those of the plain search, just cheaper to get
+            Moves are played and undone on 'board' itself, which is left as it was found
+            (even when the search is abandoned with SearchTimeout at 'deadline')
+            'first_move', if legal, is searched before the other moves
+        """
+        # determine opponent's color
+        opp_player = "B" if curr_player == "R" else "R"
+        if alpha_beta:
+            self.transpositionTable.newSearch()
+            self.moveOrderer.newSearch()
+        self.nodes = 0
+        self.root_num_moves = board.getNumMoves()
+
+        root_moves = board.getLegalMoves()
+        if first_move in root_moves:
+            root_moves.remove(first_move)
+            root_moves.insert(0, first_move)
+
+        # enumerate all legal moves
+        legal_moves = {} # will map legal move states to their alpha values
+        num_moves = board.getNumMoves()
+        self.deadline = deadline
+        if self.incremental is not None:
+            if (self.incremental.height, self.incremental.width, self.incremental.connectK) != (board.height, board.width, board.connectK):
+                self.incremental = IncrementalEvaluator(board.height, board.width, board.connectK)
+            self.incremental.reset(board)
+        try:
+            for col in root_moves:
+                # make the move in column 'col' for curr_player
+                self.play(board, col, curr_player)
+                if alpha_beta:
+                    legal_moves[col] = -self.search_alpha_beta(depth-1, board, opp_player, neg_inf, inf)
+                else:
+                    legal_moves[col] = -self.search(depth-1, board, opp_player)
+                self.unplay(board)
+        finally:
+            self.deadline = None
+            while board.getNumMoves() > num_moves:
+                board.undoMove()
+        return legal_moves
+
+    def search(self, depth, board, curr_player):
         """ Searches the tree at depth 'depth'
-            By default, the state is the board 2d array, and curr_player is whomever
+            By default, the state is the board, and curr_player is whomever
             called this search
             Returns the alpha value
         """
-
-        # enumerate all legal moves from this state
-        legal_moves = []
-        for i in range(7):
-            # if column i is a legal move...
-            if self.isLegalMove(i, state):
-                # make the move in column i for curr_player
-                temp = self.makeMove(state, i, curr_player)
-                legal_moves.append(temp)
+        self.checkDeadline()
+        self.nodes += 1
 
         # if this node (state) is a terminal node or depth == 0...
-        if depth == 0 or len(legal_moves) == 0 or self.gameIsOver(state):
+        if depth == 0 or board.isFull() or self.lastMoveWon(board):
             # return the heuristic value of node
-            if self.evalfn == "simple":
-                return self.value0(state, curr_player)
-            else:
-                return self.value(state, curr_player)
+            return self.evaluate(board, curr_player)
 
         # determine opponent's color
         opp_player = "B" if curr_player == "R" else "R"
 
+        # children are generated one at a time by playing into the board and undoing afterwards
         alpha = float('-inf')
-        for child in legal_moves:
-            if child == None:
-                print("child == None (search)")
-            alpha = max(alpha, -self.search(depth-1, child, opp_player))
+        for col in board.getLegalMoves():
+            self.play(board, col, curr_player)
+            alpha = max(alpha, -self.search(depth-1, board, opp_player))
+            self.unplay(board)
         return alpha
 
     # Search with alpha-beta pruning
-    def search_alpha_beta(self, depth, state, curr_player, a, b, maximizing_player):
-        """ Searches the tree at depth 'depth'
-            By default, the state is the board, and curr_player is whomever
-            called this search
-            Returns the alpha value
+    def search_alpha_beta(self, depth, board, curr_player, a, b):
+        """ Principal variation search: negamax alpha-beta in which only the first
+            (best-ordered) child gets the full window (a, b). Every later child is
+            first searched with a null window (a, a + NULL_WINDOW), which only asks
+            whether it beats the best move so far, and is re-searched with the full
+            window only when it does.
+            Values are from curr_player's point of view and the result is fail-soft:
+            a value <= a is an upper bound, a value >= b a lower bound, anything in
+            between exact. With (a, b) = (-inf, inf) it equals search().
         """
+        self.checkDeadline()
+        self.nodes += 1
 
-        # enumerate all legal moves from this state
-        legal_moves = []
-        for i in range(7):
-            # if column i is a legal move...
-            if self.isLegalMove(i, state):
-                # make the move in column i for curr_player
-                temp = self.makeMove(state, i, curr_player)
-                legal_moves.append(temp)
-
-        # if this node (state) is a terminal node or depth == 0...
-        if depth == 0 or len(legal_moves) == 0 or self.gameIsOver(state):
+        # if this node (state) is a terminal node...
+        if board.isFull() or self.lastMoveWon(board):
             # return the heuristic value of node
-            return self.value0(state, curr_player)
+            return self.evaluate(board, curr_player)
+
+        # a position searched before (possibly via another move order) may settle this node outright
+        key = board.getHashKey(curr_player)
+        stored, a, b, tt_move = self.transpositionTable.probe(key, depth, a, b)
+        if stored is not None:
+            return stored
+        a_orig = a
+
+        if depth == 0:
+            v = self.evaluate(board, curr_player)
+            self.transpositionTable.store(key, 0, v, EXACT)
+            return v
 
         # determine opponent's color
-        opp_player = "B" if curr_player == "R" else "B"
-
-        if maximizing_player:
-            v = neg_inf
-            for child in legal_moves:
-                if child == None:
-                    print("child == None (search)")
-
-                child = -self.search_alpha_beta(depth-1, child, opp_player, a, b, False)
-                v = max(v, child)
-                a = max(a, v)
-                if b <= a:
-                    break
-            return v
-        else:
-            v = inf
-            for child in legal_moves:
-                if child == None:
-                    print("child == None (search)")
-
-                child = -self.search_alpha_beta(depth-1, child, opp_player, a, b, True)
-                v = min(v, child)
-                b = min(b, v)
-                if b <= a:
-                    break
-            return v
+        opp_player = "B" if curr_player == "R" else "R"
 
-    def isLegalMove(self, column, state):
-        """ Boolean function to check if a move (column) is a legal move
+        # children are only played once the loop reaches them, so a cutoff skips the rest entirely
+        ply = board.getNumMoves() - self.root_num_moves
+        v = neg_inf
+        best_move = None
+        for col in self.moveOrderer.orderMoves(board.getLegalMoves(), ply, curr_player, tt_move):
+            self.play(board, col, curr_player)
+            if best_move is None:
+                child = -self.search_alpha_beta(depth-1, board, opp_player, -b, -a)
+            else:
+                child = -self.search_alpha_beta(depth-1, board, opp_player, -a - NULL_WINDOW, -a)
+                if a < child < b:
+                    child = -self.search_alpha_beta(depth-1, board, opp_player, -b, -a)
+            self.unplay(board)
+            if child > v:
+                v = child
+                best_move = col
+            a = max(a, v)
+            if b <= a:
+                self.moveOrderer.recordCutoff(col, ply, depth, curr_player)
+                break
+        self.transpositionTable.store(key, depth, v, boundType(v, a_orig, b), best_move)
+        return v
+
+    def play(self, board, col, color):
+        """ board.addPiece, keeping the incremental evaluation in step """
+        board.addPiece(col, color)
+        if self.incremental is not None:
+            self.incremental.pieceAdded(board)
+
+    def unplay(self, board):
+        """ board.undoMove, keeping the incremental evaluation in step """
+        board.undoMove()
+        if self.incremental is not None:
+            self.incremental.pieceRemoved(board)
+
+    def lastMoveWon(self, board):
+        if self.incremental is not None:
+            return self.incremental.lastMoveWon(board)
+        return board.getLastMoveWinner() is not None
+
+    def evaluate(self, board, color):
+        """ Heuristic value of the board for 'color', using the evalfn chosen at construction
+            Computed on the bitboards; equal to value0 / value on board.getState2dArray()
         """
-        for i in range(6):
-            if state[i][column] == 'O':
-
-                # once we find the first empty, we know it's a legal move
-                return True
-
-        # if we get here, the column is full
-        return False
-
-    def gameIsOver(self, state):
-        if self.checkForStreak(state, "R", 4) >= 1:
-            return True
-        elif self.checkForStreak(state, "B", 4) >= 1:
-            return True
+        if self.incremental is not None:
+            return self.incremental.value0(color)
+        evaluator = getPatternEvaluator(board.height, board.width, board.connectK)
+        if self.evalfn == "simple":
+            return evaluator.value0(board, color)
         else:
-            return False
-
+            return evaluator.value(board, color)
 
-    def makeMove(self, state, column, color):
-        """ Change a state object to reflect a player, denoted by color,
-            making a move at column 'column'
-            Returns a copy of new state array with the added move
-        """
-
-        temp = [x[:] for x in state]
-        for i in range(6):
-            if temp[i][column] == 'O':
-                temp[i][column] = color
-                return temp
+    def checkDeadline(self):
+        if self.deadline is not None and time.time() >= self.deadline:
+            raise SearchTimeout()
 
     def value0(self, state, color):
         """ Simple heuristic to evaluate board configurations
@@ -221,7 +269,7 @@ class Minimax(object):
         feature_dict["my_centrality_score"] = (self.centralityScore(state, color), 0.8)
         feature_dict["opp_centrality_score"] = (self.centralityScore(state, o_color), 0.8)
 
-        if feature_dict["opp_fours"] > 0:
+        if feature_dict["opp_fours"][0] > 0:
             return -100000
         else:
             return sum([val[0] * val[1] for val in feature_dict.values()])  # weighted sum of feature values
@@ -236,6 +284,8 @@ class Minimax(object):
                 if state[i][j] == color:
                     count += 1
                     score += col_scores[j]
+        if count == 0:
+            return 0.0
         return (score+0.0) / count
 
     # Check for a 3-in-a-row with empty spaces on both sides :0
@@ -1,7 +1,6 @@
 from subprocess import Popen, PIPE, STDOUT
 import sys, random
 import board  
-import mcts
 
 class HumanPlayer(object):
     """Object queried by ConnectFourGame to get human player's move."""
@@ -36,14 +35,57 @@ class RandomPlayer(object):
         return col
 
 class MctsPlayer(object):
-    def __init__(self, name="MCTS", color=None, budget=1000):
+    def __init__(self, name="MCTS", color=None, budget=1000, playouts=1, reuse_tree=True, max_tree_mb=None,
+                 workers=1, parallel="root", time_limit_ms=None, early_stop=True,
+                 rollout="uniform", center_bias=1.0, prior=None, bias_weight=1.0, td_weights=None):
+        # mcts (and multiprocessing, for parallel search) are only loaded once an MCTS player is made
+        import mcts
         self.name = name
-        self.budget = budget
-        self.mcts_game = mcts.ConnectFour(height=6, width=7, target=4)
-        self.mcts_state = ((),) * 7
-        self.mcts_budget = budget
+        self.budget = budget  # iterations per move; may be None when time_limit_ms is set
+        self.time_limit_ms = time_limit_ms  # wall-clock budget per move
+        self.early_stop = early_stop  # stop once no other move can catch up with the most visited one
+        self.last_stats = None  # MctsSearch.stats() of the last move
+        self.playouts = playouts  # random games simulated from each new tree node
+        # keep the subtree below each move played instead of starting every search from scratch
+        self.reuse_tree = reuse_tree
+        self.max_tree_nodes = None if max_tree_mb is None else int(max_tree_mb * 2 ** 20) // mcts.Tree.bytes_per_node()
+        # with several workers each searches 'budget' iterations in its own process, "root" in
+        # separate trees and "tree" in one shared tree; trees are then not kept between turns
+        self.workers = workers
+        self.parallel = parallel
+        self.pool = None
+        # rollout policy: "uniform", "center" (central columns more likely) or "heuristic"
+        # (center bias plus playing immediate wins and blocking the opponent's)
+        if rollout == "uniform":
+            self.rollout = None
+        elif rollout == "center":
+            self.rollout = mcts.HeuristicRollout(win_block=False, center_bias=center_bias)
+        elif rollout == "heuristic":
+            self.rollout = mcts.HeuristicRollout(center_bias=center_bias)
+        else:
+            raise ValueError("Unrecognized rollout policy: %s" % rollout)
+        self.mcts_game = mcts.BitboardConnectFour(height=6, width=7, target=4)
+        self.mcts_state = self.mcts_game.initial_state()
+        # progressive bias towards moves rated well by the value0 heuristic ("value0") or by the
+        # TD network whose getWeights() are td_weights ("td")
+        if prior is None:
+            self.prior = None
+        elif prior == "value0":
+            self.prior = mcts.HeuristicPrior()
+        elif prior == "td":
+            self.prior = mcts.TDPrior(td_weights, self.mcts_game.height, self.mcts_game.width)
+        else:
+            raise ValueError("Unrecognized prior: %s" % prior)
+        self.bias_weight = bias_weight
+        self.tree = None
         self.color = color
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
     def setColor(self, color):
         self.color = color
 
@@ -52,17 +94,54 @@ class MctsPlayer(object):
             player = self.mcts_game.players[0] if color == "R" else self.mcts_game.players[1]
             print("updating mcts game: %d, playa %d" % (columnNumber, player))
             self.mcts_state = self.mcts_game.result(self.mcts_state, columnNumber, player)
+            if self.tree is not None:
+                self.tree = self.tree.subtree(columnNumber)
 
     def getMove(self, board):
+        import mcts
         player = self.mcts_game.players[0] if self.color == "R" else self.mcts_game.players[1]
-        action = mcts.mcts_uct(self.mcts_game, self.mcts_state, player, self.mcts_budget)
+        if self.workers > 1:
+            if self.parallel == "root" and self.pool is None:
+                import multiprocessing
+                self.pool = multiprocessing.Pool(self.workers)
+            action = mcts.mcts_uct_parallel(self.mcts_game, self.mcts_state, player, self.budget,
+                                            self.workers, self.parallel, self.playouts, pool=self.pool,
+                                            time_limit=self.timeLimit(), rollout=self.rollout,
+                                            prior=self.prior, bias_weight=self.bias_weight)
+            self.mcts_state = self.mcts_game.result(self.mcts_state, action, player)
+            print("MCTS playing action %d, playa %d" % (action, player))
+            return action
+        tree = None
+        if self.reuse_tree and self.tree is not None and self.tree.state == self.mcts_state and self.tree.player == player:
+            tree = self.tree
+        capacity = self.budget + 1 if self.budget is not None else 1024
+        search = mcts.MctsSearch(self.mcts_game, self.mcts_state, player, self.playouts, tree, capacity, self.max_tree_nodes,
+                                 self.rollout, self.prior, self.bias_weight)
+        action = search.run(self.budget, self.timeLimit(), self.early_stop)
+        self.last_stats = search.stats()
         self.mcts_state = self.mcts_game.result(self.mcts_state, action, player)
+        self.tree = search.tree.subtree(action) if self.reuse_tree else None
         print("MCTS playing action %d, playa %d" % (action, player))
         return action
 
+    def timeLimit(self):
+        return None if self.time_limit_ms is None else self.time_limit_ms / 1000.0
+
+    def close(self):
+        """ Shuts down the worker processes of root-parallel search, if they were started.
+            The player can still be used: the next parallel search starts new ones
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
     def reset(self):
-        self.mcts_game = mcts.ConnectFour(height=6, width=7, target=4)
-        self.mcts_state = ((),) * 7
+        import mcts
+        self.close()
+        self.mcts_game = mcts.BitboardConnectFour(height=6, width=7, target=4)
+        self.mcts_state = self.mcts_game.initial_state()
+        self.tree = None
         
 class VelengPlayer(object):
     def __init__(self, name="Veleng", color=None):
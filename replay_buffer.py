@@ -0,0 +1,49 @@
+"""
+Experience replay for TD training.
+
+Training one position per optimizer step spends almost all of each session
+call on overhead, and consecutive positions of a game are strongly correlated.
+ReplayBuffer keeps the most recent (board, target) pairs in preallocated NumPy
+arrays used as a ring, so adding is a slice assignment and old positions are
+overwritten in place, and hands out random minibatches of them for the train
+steps.
+"""
+import numpy as np
+
+
+class ReplayBuffer(object):
+
+    def __init__(self, capacity, inputSize=42, seed=None):
+        self.capacity = capacity
+        self.boards = np.zeros((capacity, inputSize), dtype=np.float32)
+        self.targets = np.zeros(capacity, dtype=np.float32)
+        self.size = 0  # positions stored, at most capacity
+        self.next = 0  # slot the next position goes into
+        self.rng = np.random.RandomState(seed)
+
+    def __len__(self):
+        return self.size
+
+    def add(self, boards, targets):
+        """ Stores the boards (one network input per row) with their targets, overwriting the
+            oldest positions once the buffer is full
+        """
+        boards = np.asarray(boards, dtype=np.float32)
+        targets = np.asarray(targets, dtype=np.float32).reshape(-1)
+        if len(boards) > self.capacity:
+            boards, targets = boards[-self.capacity:], targets[-self.capacity:]
+        count = len(boards)
+        first = min(count, self.capacity - self.next)  # up to the end of the arrays, the rest wraps around
+        self.boards[self.next:self.next + first] = boards[:first]
+        self.targets[self.next:self.next + first] = targets[:first]
+        self.boards[:count - first] = boards[first:]
+        self.targets[:count - first] = targets[first:]
+        self.next = (self.next + count) % self.capacity
+        self.size = min(self.size + count, self.capacity)
+
+    def sample(self, batchSize):
+        """ Returns (boards, targets) for batchSize positions drawn uniformly with replacement,
+            targets shaped (batchSize, 1) like the network's output
+        """
+        indices = self.rng.randint(0, self.size, size=batchSize)
+        return self.boards[indices], self.targets[indices].reshape(-1, 1)
@@ -0,0 +1,150 @@
+"""
+Batched self-play for TD training.
+
+TemporalDifferenceLearner.playVirtualGame plays one game at a time on a
+ConnectFourBoard: every candidate move is an addPiece, a session call and an
+undoMove, and every position goes through boardToMatrix's Python double loop.
+SelfPlayEnv plays B games in lockstep on a (B, height, width) NumPy array
+instead, already in boardToMatrix's layout (row 0 is the top of the board,
++1 red, -1 black), so its rows are network inputs as they stand. Each ply
+scores every move of every game in one network call, checks all the boards for
+a win with array slicing, and restarts the games that ended in place, so the
+batch stays full.
+"""
+import numpy as np
+
+# TemporalDifferenceLearner.makeMove's targets for a position that ends the game
+WIN_TARGETS = {1: 10.0, -1: -12.0}  # by the winner's color
+DRAW_TARGET = -1.0
+END_REPEATS = 5  # makeMove trains 5 times on such a position
+
+
+def explorationRate(gamesPlayed):
+    """ The epsilon TemporalDifferenceLearner.train uses after gamesPlayed games """
+    return 0.05 if gamesPlayed < 40000 else max(0, 0.04 - gamesPlayed / (3.0 * 1e6))
+
+
+def gameResults(winners, full):
+    """ {"R": games won by red, "B": by black, "Draw": drawn} for tdExamples' winners and full """
+    return {"R": int(np.sum(winners > 0)), "B": int(np.sum(winners < 0)), "Draw": int(np.sum(full))}
+
+
+def tdExamples(env, evaluate, epsilon, gamma, onlyEnded=False):
+    """ Plays a ply in every game of env (see SelfPlayEnv.step) and returns (inputs, targets,
+        winners, full): the positions reached, one per row, with makeMove's targets. Those are
+        the reward for a position that ends its game, repeated END_REPEATS times, and gamma
+        times its value otherwise. With onlyEnded, only game-ending positions are returned,
+        as makeMove does in the first 1000 games. Finished games are then restarted.
+    """
+    values, winners, full = env.step(evaluate, epsilon)
+    ended = (winners != 0) | full
+    targets = values * gamma
+    targets[winners > 0] = WIN_TARGETS[1]
+    targets[winners < 0] = WIN_TARGETS[-1]
+    targets[full] = DRAW_TARGET
+    keep = ended if onlyEnded else np.ones(env.batchSize, dtype=bool)
+    rows = np.repeat(np.nonzero(keep)[0], np.where(ended, END_REPEATS, 1)[keep])
+    inputs = env.boardVecs()[rows]
+    env.reset(ended)
+    return inputs, targets[rows], winners, full
+
+
+class SelfPlayEnv(object):
+
+    def __init__(self, batchSize, height=6, width=7, connectK=4, seed=None):
+        self.batchSize = batchSize
+        self.height = height
+        self.width = width
+        self.connectK = connectK
+        self.rng = np.random.RandomState(seed)
+        self.boards = np.zeros((batchSize, height, width), dtype=np.float32)
+        self.fillHeights = np.zeros((batchSize, width), dtype=np.int64)
+        self.colors = np.ones(batchSize, dtype=np.float32)  # color to move in each game: +1 red, -1 black
+        self.games = np.arange(batchSize)
+
+    def reset(self, games=None):
+        """ Restarts the games selected by 'games' (a boolean mask or indices; all by default) """
+        if games is None:
+            games = slice(None)
+        self.boards[games] = 0
+        self.fillHeights[games] = 0
+        self.colors[games] = 1
+
+    def boardVecs(self):
+        """ The boards as network inputs, one per row, like TemporalDifferenceLearner.boardToVec """
+        return self.boards.reshape(self.batchSize, self.height * self.width)
+
+    def legalMoves(self):
+        """ (B, width) mask of the columns that are not full """
+        return self.fillHeights < self.height
+
+    def childVecs(self):
+        """ (B, width, height * width) inputs for the board after each move by the side to move.
+            The entries for full columns are the unchanged board
+        """
+        B, H, W = self.boards.shape
+        children = np.repeat(self.boardVecs()[:, None, :], W, axis=1)
+        legal = self.legalMoves()
+        games, cols = np.nonzero(legal)
+        squares = (H - 1 - self.fillHeights[games, cols]) * W + cols
+        children[games, cols, squares] = self.colors[games]
+        return children
+
+    def chooseMoves(self, values, epsilon=0.0):
+        """ Epsilon-greedy moves for every game from 'values', the (B, width) red's-point-of-view
+            values of each child: red maximizes, black minimizes, ties are broken at random and
+            with probability epsilon a game plays a uniformly random legal move instead.
+            Returns (moves, values of the moves chosen)
+        """
+        legal = self.legalMoves()
+        scores = np.where(legal, values * self.colors[:, None], -np.inf)
+        best = (scores == scores.max(axis=1, keepdims=True)) & legal
+        explore = self.rng.rand(self.batchSize) < epsilon
+        candidates = np.where(explore[:, None], legal, best)
+        moves = np.argmax(candidates * self.rng.rand(self.batchSize, self.width), axis=1)
+        return moves, values[self.games, moves]
+
+    def play(self, moves):
+        """ Plays one move in every game for the side to move. Returns (winners, full): winners
+            holds the color that just won each game, or 0, and full marks the drawn boards
+        """
+        rows = self.height - 1 - self.fillHeights[self.games, moves]
+        self.boards[self.games, rows, moves] = self.colors
+        self.fillHeights[self.games, moves] += 1
+        won = self.hasLine(self.boards == self.colors[:, None, None])
+        winners = np.where(won, self.colors, 0)
+        full = ~won & (self.fillHeights.sum(axis=1) == self.height * self.width)
+        self.colors = -self.colors
+        return winners, full
+
+    def hasLine(self, pieces):
+        """ For a (B, height, width) boolean array, which of the B boards contain connectK in a row """
+        K = self.connectK
+        found = np.zeros(len(pieces), dtype=bool)
+        for drow, dcol in ((0, 1), (1, 0), (1, 1), (1, -1)):
+            rows = self.height - (K - 1) * drow
+            cols = self.width - (K - 1) * abs(dcol)
+            if rows <= 0 or cols <= 0:
+                continue
+            # lines[:, r, c]: the K squares from (r, c) in this direction are all set;
+            # going down-left the lines start K - 1 columns in
+            lines = np.ones((len(pieces), rows, cols), dtype=bool)
+            for k in range(K):
+                row = k * drow
+                col = k * dcol + (K - 1 if dcol < 0 else 0)
+                lines &= pieces[:, row:row + rows, col:col + cols]
+            found |= lines.any(axis=(1, 2))
+        return found
+
+    def step(self, evaluate, epsilon=0.0):
+        """ Plays an epsilon-greedy move in every game, scoring all the moves of all the games
+            with one call to evaluate (e.g. TemporalDifferenceLearner.forwardEvaluation, which
+            takes one input per row and returns (N, 1) values). Finished games are not reset
+            here, so their final boards can still be read. Returns (values of the moves played,
+            winners, full) as in chooseMoves and play
+        """
+        children = self.childVecs().reshape(self.batchSize * self.width, -1)
+        values = np.asarray(evaluate(children)).reshape(self.batchSize, self.width)
+        moves, chosen = self.chooseMoves(values, epsilon)
+        winners, full = self.play(moves)
+        return chosen, winners, full
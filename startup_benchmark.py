@@ -0,0 +1,62 @@
+"""
+Startup benchmark for connect_four.py: for each engine, starts a fresh Python
+process, loads the game the way connect_four.py does, makes the player and
+times how long it takes until its first move has been chosen, interpreter
+start-up included. Also lists which of the heavy backends each engine ended
+up importing. The last engine is made through test_td_alpha_beta.py, the
+driver for TDAlphaBeta games, to cover the path that used to load TensorFlow.
+
+    python startup_benchmark.py [runs per engine]
+"""
+from __future__ import print_function
+import os
+import subprocess
+import sys
+import time
+
+HEAVY_MODULES = ("tensorflow", "numpy", "temporal_difference", "td_alpha_beta", "td_inference", "mcts", "multiprocessing")
+
+# modules imported and code run in the child process to make each player
+ENGINES = [
+    ("minimax, depth 4", "connect_four", 'ConnectFourAgent(color="R", algorithm="minimax", depth=4)'),
+    ("alphabeta, depth 6", "connect_four", 'ConnectFourAgent(color="R", algorithm="alphabeta", depth=6)'),
+    ("mcts, 1000 iterations", "connect_four", 'MctsPlayer(color="R", budget=1000)'),
+    ("TDAlphaBeta (NumPy network), depth 4", "connect_four",
+     'ConnectFourAgent(color="R", algorithm="TDAlphaBeta", depth=4, '
+     'tdEvaluator=__import__("td_inference").loadEvaluator("./model_ckpt400000"))'),
+    ("TDAlphaBeta via test_td_alpha_beta, depth 4", "test_td_alpha_beta",
+     'agent.ConnectFourAgent(color="R", algorithm="TDAlphaBeta", depth=4, '
+     'tdEvaluator=td_inference.loadEvaluator("./model_ckpt400000"))'),
+]
+
+CHILD = """
+import sys, time
+from %s import *
+from board import ConnectFourBoard
+player = %s
+board = ConnectFourBoard()
+board.addPiece(3, "B")  # an empty board is answered without searching by some engines
+player.getMove(board)
+print("seconds: %%f" %% (time.time() - %r))
+print("loaded: " + " ".join(name for name in %r if name in sys.modules))
+"""
+
+
+def timeFirstMove(module, engine):
+    """ Returns (seconds to the first move, heavy modules loaded) in a new process """
+    start = time.time()
+    output = subprocess.check_output([sys.executable, "-c", CHILD % (module, engine, start, HEAVY_MODULES)],
+                                     cwd=os.path.dirname(os.path.abspath(__file__)),
+                                     universal_newlines=True)
+    # the players print as they move, so only the last two lines are ours
+    seconds, loaded = output.splitlines()[-2:]
+    return float(seconds.split(":")[1]), loaded.split(":")[1].split()
+
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    for name, module, engine in ENGINES:
+        results = [timeFirstMove(module, engine) for run in range(runs)]
+        seconds = sorted(result[0] for result in results)
+        print("%-45s median %6.0f ms  best %6.0f ms  loads: %s" % (
+            name, 1000 * seconds[len(seconds) // 2], 1000 * seconds[0], ", ".join(results[-1][1]) or "-"))
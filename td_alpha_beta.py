@@ -1,23 +1,109 @@
 
 __author__ = 'pranavsriram'
-import copy
 import board
-import random, sys
-import temporal_difference
+import random, sys, time
+import numpy as np
+from minimax import SearchTimeout
+from transposition import TranspositionTable, EXACT, boundType
+from move_ordering import MoveOrderer
 
 neg_inf = float('-inf')
 inf = float('inf')
 
 # Note: all evaluation done from perspective of red, the maximizer
 
+class IncrementalTDEvaluator(object):
+    """ The TD network's first layer, kept up to date while the search makes and undoes moves.
+
+        The input vector has one entry per square (+1 red, -1 black, 0 empty), so
+        boardVec . W1 changes by exactly +-W1[square] when a piece is placed. That
+        running sum is all the first layer needs; a leaf only pays for the small
+        layers above it, computed in numpy without a session call.
+        Same result as TemporalDifferenceLearner.forwardEvaluation, up to float rounding.
+    """
+
+    def __init__(self, weights, height=6, width=7):
+        self.height = height
+        self.width = width
+        self.setWeights(weights)
+        self.accumulator = np.zeros_like(self.b1)
+        self.history = []
+
+    def setWeights(self, weights):
+        """ 'weights' as returned by TemporalDifferenceLearner.getWeights """
+        W1 = np.asarray(weights["W1"], dtype=np.float32)
+        self.pieceRows = {"R": W1, "B": -W1}  # what placing a piece on each square adds to the accumulator
+        self.b1 = np.asarray(weights["b1"], dtype=np.float32)
+        self.W2 = np.asarray(weights["W2"], dtype=np.float32)
+        self.b2 = np.asarray(weights["b2"], dtype=np.float32)
+        self.W3 = np.asarray(weights["W3"], dtype=np.float32)
+        self.b3 = np.asarray(weights["b3"], dtype=np.float32)
+        self.W4 = np.asarray(weights["W4"], dtype=np.float32)
+        self.b4 = np.asarray(weights["b4"], dtype=np.float32)
+
+    def inputIndex(self, col, row):
+        # same square order as TemporalDifferenceLearner.boardToVec
+        return (self.height - 1 - row) * self.width + col
+
+    def reset(self, board):
+        self.accumulator = np.zeros_like(self.b1)
+        for col in range(board.width):
+            for row in range(board.columnFillHeights[col]):
+                self.accumulator += self.pieceRows[board.columns[col][row]][self.inputIndex(col, row)]
+        self.history = []
+
+    def resetBits(self, redBits, blackBits):
+        """ Same as reset, for a position given as ConnectFourBoard-layout bitboards """
+        stride = self.height + 1
+        boardVec = np.zeros(self.height * self.width, dtype=np.float32)
+        for col in range(self.width):
+            for row in range(self.height):
+                bit = 1 << (col * stride + row)
+                if redBits & bit:
+                    boardVec[self.inputIndex(col, row)] = 1
+                elif blackBits & bit:
+                    boardVec[self.inputIndex(col, row)] = -1
+        self.accumulator = boardVec.dot(self.pieceRows["R"])
+        self.history = []
+
+    def pieceAdded(self, board):
+        """ Call right after board.addPiece """
+        col = board.moves[-1]
+        row = board.columnFillHeights[col] - 1
+        self.history.append(self.accumulator)
+        self.accumulator = self.accumulator + self.pieceRows[board.columns[col][row]][self.inputIndex(col, row)]
+
+    def pieceRemoved(self, board):
+        """ Call right after board.undoMove """
+        self.accumulator = self.history.pop()
+
+    def evaluate(self):
+        """ Network value of the current board, from red's perspective """
+        hidden1 = np.maximum(self.accumulator, 0) + self.b1
+        hidden2 = np.maximum(hidden1.dot(self.W2), 0) + self.b2
+        hidden3 = np.maximum(hidden2.dot(self.W3), 0) + self.b3
+        return float(hidden3.dot(self.W4)[0] + self.b4[0])
+
+
 class TDAlphaBeta(object):
     """ Combines alpha-beta search with learned TD evaluation function."""
 
-    def __init__(self, tdEvaluator):
+    def __init__(self, tdEvaluator, transpositionTable=None, moveOrderer=None, incremental=True):
         self.tdEvaluator = tdEvaluator
-
-    def bestMove(self, depth, board, curr_player):
+        # evaluate leaves from an accumulator updated on make/unmake instead of a session call per leaf
+        self.useIncremental = incremental and hasattr(tdEvaluator, "getWeights")
+        self.incremental = None  # IncrementalTDEvaluator of the current search
+        # values are stored from red's point of view, like everything else in this search
+        self.transpositionTable = transpositionTable if transpositionTable is not None else TranspositionTable()
+        self.moveOrderer = moveOrderer if moveOrderer is not None else MoveOrderer()
+        self.deadline = None  # time.time() value after which a search raises SearchTimeout
+        self.nodes = 0  # nodes visited by the last bestMove call
+        self.rootNumMoves = 0
+
+    def bestMove(self, depth, board, curr_player, deadline=None, first_move=None):
         """ Returns the best move (as a column number) and the associated alpha
+            'board' is left as it was found, even when the search is abandoned with
+            SearchTimeout at 'deadline'. 'first_move', if legal, is searched first.
         """
         if board.isEmpty(): return 3  # hard code first move
 
@@ -25,15 +111,33 @@ class TDAlphaBeta(object):
 
         # determine opponent's color
         opp_player = "B" if curr_player == "R" else "R"
+        self.transpositionTable.newSearch()
+        self.moveOrderer.newSearch()
+        self.nodes = 0
+        self.rootNumMoves = board.getNumMoves()
 
         # enumerate all legal moves
         allowed_moves = board.getLegalMoves()
+        if first_move in allowed_moves:
+            allowed_moves.remove(first_move)
+            allowed_moves.insert(0, first_move)
         moveValues = {} # will map legal moves to their alpha values
-        for col in allowed_moves:
-            # make the move in column 'col' for curr_player
-            boardCopy = copy.deepcopy(board)
-            boardCopy.addPiece(col, curr_player)
-            moveValues[col] = self.search_alpha_beta(depth-1, boardCopy, opp_player, neg_inf, inf, (not maximizer))
+        numMoves = board.getNumMoves()
+        self.deadline = deadline
+        if self.useIncremental:
+            # the network may have trained since the last search
+            self.incremental = IncrementalTDEvaluator(self.tdEvaluator.getWeights(), board.height, board.width)
+            self.incremental.reset(board)
+        try:
+            for col in allowed_moves:
+                # make the move in column 'col' for curr_player, search it, then take it back
+                self.play(board, col, curr_player)
+                moveValues[col] = self.search_alpha_beta(depth-1, board, opp_player, neg_inf, inf, (not maximizer))
+                self.unplay(board)
+        finally:
+            self.deadline = None
+            while board.getNumMoves() > numMoves:
+                board.undoMove()
               
         
         best_move = None
@@ -59,49 +163,86 @@ class TDAlphaBeta(object):
         """ Searches the tree at depth 'depth'
             curr_player is whoever called this search
             Returns the alpha value 
+            Children are played into 'board' and undone, so it is left as it was found
         """
+        if self.deadline is not None and time.time() >= self.deadline:
+            raise SearchTimeout()
+        self.nodes += 1
 
-        legalMoves = board.getLegalMoves()
-        opp_player = "B" if curr_player == "R" else "B"
+        opp_player = "B" if curr_player == "R" else "R"
         
         # Handle terminal nodes and depth=0 
         if board.isFull():  # Draw
             return 0.0
 
-        winner = board.containsFourInARow()
+        winner = board.getLastMoveWinner()
         if winner:
-            return (20.0 + depth) if winner == "R" else -(depth+20.0)  # win early, lose late
+            # win early, lose late: counted in moves on the board rather than remaining depth, so a
+            # win scores the same whichever search stored it in the transposition table
+            score = 20.0 + board.width * board.height - board.getNumMoves()
+            return score if winner == "R" else -score
+
+        # Positions reached before through another move order (network evaluations included)
+        key = board.getHashKey(curr_player)
+        stored, a, b, ttMove = self.transpositionTable.probe(key, depth, a, b)
+        if stored is not None:
+            return stored
+        a_orig, b_orig = a, b
 
         if depth == 0:
-            return self.evaluate(board)  # return heuristic value 
+            v = self.evaluate(board)  # return heuristic value 
+            self.transpositionTable.store(key, 0, v, EXACT)
+            return v
 
         # Otherwise 
 
+        ply = board.getNumMoves() - self.rootNumMoves
+        legalMoves = self.moveOrderer.orderMoves(board.getLegalMoves(), ply, curr_player, ttMove)
+        bestMove = None
         if maximizing_player:
             v = neg_inf
             for move in legalMoves:
-                newBoard = copy.deepcopy(board)
-                newBoard.addPiece(move, curr_player)
-                childVal = self.search_alpha_beta(depth-1, newBoard, opp_player, a, b, False)
-                v = max(v, childVal)
+                self.play(board, move, curr_player)
+                childVal = self.search_alpha_beta(depth-1, board, opp_player, a, b, False)
+                self.unplay(board)
+                if childVal > v:
+                    v = childVal
+                    bestMove = move
                 a = max(a, v)
                 if b <= a:
+                    self.moveOrderer.recordCutoff(move, ply, depth, curr_player)
                     break
-            return v
         else:
             v = inf
             for move in legalMoves:
-                newBoard = copy.deepcopy(board)
-                newBoard.addPiece(move, curr_player)
-                childVal = self.search_alpha_beta(depth-1, newBoard, opp_player, a, b, True)
-                v = min(v, childVal)
+                self.play(board, move, curr_player)
+                childVal = self.search_alpha_beta(depth-1, board, opp_player, a, b, True)
+                self.unplay(board)
+                if childVal < v:
+                    v = childVal
+                    bestMove = move
                 b = min(b, v)
                 if b <= a:
+                    self.moveOrderer.recordCutoff(move, ply, depth, curr_player)
                     break
-            return v
+        self.transpositionTable.store(key, depth, v, boundType(v, a_orig, b_orig), bestMove)
+        return v
+
+    def play(self, board, col, color):
+        """ board.addPiece, keeping the incremental evaluation in step """
+        board.addPiece(col, color)
+        if self.incremental is not None:
+            self.incremental.pieceAdded(board)
+
+    def unplay(self, board):
+        """ board.undoMove, keeping the incremental evaluation in step """
+        board.undoMove()
+        if self.incremental is not None:
+            self.incremental.pieceRemoved(board)
 
     def evaluate(self, board):
+        if self.incremental is not None:
+            return self.incremental.evaluate()
         boardVec = self.tdEvaluator.boardToVec(board)
-        return self.tdEvaluator.forwardEvaluation(boardVec)
+        return float(self.tdEvaluator.forwardEvaluation(boardVec)[0, 0])
 
-    
\ No newline at end of file
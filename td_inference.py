@@ -0,0 +1,242 @@
+"""
+Inference-only evaluator for the trained TD networks.
+
+TemporalDifferenceLearner builds a TensorFlow graph, a session and an Adam
+optimizer, which is a lot of start-up for playing with a 42-24-16-8-1 MLP.
+TDInference evaluates the same network with a few NumPy matmuls, and has the
+tdEvaluator interface TDAlphaBeta uses (boardToVec, forwardEvaluation,
+getWeights), so it can stand in for the learner at play time.
+
+Weights come from the learner's model_ckpt* checkpoints. Those are TensorFlow
+tensor bundles: a .index file, which is a table mapping each variable name to
+its dtype, shape and byte range, and .data-* files holding the raw tensors.
+readCheckpoint parses that format directly, so TensorFlow is not needed even
+for the one-off conversion to .npz that loadEvaluator caches next to the
+checkpoint.
+"""
+import os
+import struct
+
+import numpy as np
+
+WEIGHT_NAMES = ("W1", "b1", "W2", "b2", "W3", "b3", "W4", "b4")
+
+# tensorflow DataType enum values, as stored in the checkpoint index
+DTYPES = {1: np.float32, 2: np.float64}
+
+TABLE_MAGIC = 0xdb4775248b80fb57
+FOOTER_SIZE = 48
+BLOCK_TRAILER_SIZE = 5  # compression type byte and crc after every table block
+
+
+def crc32cTable():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for bit in range(8):
+            crc = (crc >> 1) ^ 0x82f63b78 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+CRC32C_TABLE = crc32cTable()
+
+
+def maskedCrc32c(data):
+    """ The CRC-32C of data, masked the way tensor bundles store it with each tensor """
+    crc = 0xffffffff
+    for byte in bytearray(data):
+        crc = CRC32C_TABLE[(crc ^ byte) & 0xff] ^ (crc >> 8)
+    crc ^= 0xffffffff
+    return ((((crc >> 15) | (crc << 17)) & 0xffffffff) + 0xa282ead8) & 0xffffffff
+
+
+def readVarint(data, pos):
+    """ Returns (value, position after it) for the protobuf/leveldb varint at data[pos] """
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if byte < 0x80:
+            return value, pos
+
+
+def readBlockHandle(data, pos):
+    """ Returns (offset, size, position after the handle) """
+    offset, pos = readVarint(data, pos)
+    size, pos = readVarint(data, pos)
+    return offset, size, pos
+
+
+def readBlock(data, offset, size):
+    """ Yields the (key, value) entries of the uncompressed table block at data[offset:offset + size] """
+    if data[offset + size] != 0:
+        raise ValueError("Compressed checkpoint index blocks are not supported")
+    block = data[offset:offset + size]
+    numRestarts = struct.unpack("<I", block[-4:])[0]
+    end = len(block) - 4 * (numRestarts + 1)
+    pos = 0
+    key = b""
+    while pos < end:
+        shared, pos = readVarint(block, pos)
+        unshared, pos = readVarint(block, pos)
+        valueLength, pos = readVarint(block, pos)
+        key = key[:shared] + block[pos:pos + unshared]
+        pos += unshared
+        yield key, block[pos:pos + valueLength]
+        pos += valueLength
+
+
+def readMessage(message):
+    """ Decodes a protobuf message into {field number: [values]}; varints as ints, the rest as bytes """
+    fields = {}
+    pos = 0
+    while pos < len(message):
+        tag, pos = readVarint(message, pos)
+        field, wireType = tag >> 3, tag & 7
+        if wireType == 0:
+            value, pos = readVarint(message, pos)
+        elif wireType == 1:
+            value, pos = message[pos:pos + 8], pos + 8
+        elif wireType == 2:
+            length, pos = readVarint(message, pos)
+            value, pos = message[pos:pos + length], pos + length
+        elif wireType == 5:
+            value, pos = message[pos:pos + 4], pos + 4
+        else:
+            raise ValueError("Unexpected protobuf wire type %d" % wireType)
+        fields.setdefault(field, []).append(value)
+    return fields
+
+
+def readCheckpoint(prefix):
+    """ Returns {variable name: array} for every tensor in the checkpoint 'prefix'
+        (e.g. "./model_ckpt400000" for model_ckpt400000.index and its .data-* files),
+        Adam slots included. Each tensor's bytes are checked against the checksum the
+        index keeps for it, so a wrong offset or size raises ValueError
+    """
+    with open(prefix + ".index", "rb") as f:
+        index = f.read()
+    footer = index[-FOOTER_SIZE:]
+    if struct.unpack("<Q", footer[-8:])[0] != TABLE_MAGIC:
+        raise ValueError("%s.index is not a checkpoint index" % prefix)
+    _, _, pos = readBlockHandle(footer, 0)  # metaindex, unused
+    indexOffset, indexSize, _ = readBlockHandle(footer, pos)
+
+    entries = {}
+    for _, handle in readBlock(index, indexOffset, indexSize):
+        offset, size, _ = readBlockHandle(handle, 0)
+        for key, value in readBlock(index, offset, size):
+            entries[key.decode("utf-8")] = readMessage(value)
+    header = entries.pop("")  # BundleHeaderProto
+    numShards = header.get(1, [1])[0]
+
+    shards = {}
+    tensors = {}
+    for name, entry in entries.items():  # BundleEntryProto
+        dtype = DTYPES.get(entry.get(1, [0])[0])
+        if dtype is None:
+            continue
+        shape = tuple(readMessage(dim).get(1, [0])[0] for dim in readMessage(entry.get(2, [b""])[0]).get(2, []))
+        shard = entry.get(3, [0])[0]
+        offset = entry.get(4, [0])[0]
+        size = entry.get(5, [0])[0]
+        if shard not in shards:
+            with open("%s.data-%05d-of-%05d" % (prefix, shard, numShards), "rb") as f:
+                shards[shard] = f.read()
+        data = shards[shard][offset:offset + size]
+        if 6 in entry and maskedCrc32c(data) != struct.unpack("<I", entry[6][0])[0]:
+            raise ValueError("Checksum mismatch for %s in %s" % (name, prefix))
+        values = np.frombuffer(data, dtype=np.dtype(dtype).newbyteorder("<"))
+        tensors[name] = values.reshape(shape).astype(dtype)
+    return tensors
+
+
+def checkpointWeights(prefix):
+    """ The network weights W1..b4 from a checkpoint, as float32 arrays """
+    tensors = readCheckpoint(prefix)
+    missing = [name for name in WEIGHT_NAMES if name not in tensors]
+    if missing:
+        raise ValueError("%s has no variables %s" % (prefix, ", ".join(missing)))
+    return dict((name, tensors[name].astype(np.float32)) for name in WEIGHT_NAMES)
+
+
+def convertCheckpoint(prefix, npzPath=None):
+    """ Saves the network weights of a checkpoint as an .npz (prefix + ".npz" by default) and returns its path """
+    if npzPath is None:
+        npzPath = prefix + ".npz"
+    np.savez(npzPath, **checkpointWeights(prefix))
+    return npzPath
+
+
+def loadWeights(path):
+    """ Network weights from an .npz or a checkpoint prefix. A checkpoint is converted to
+        prefix + ".npz" the first time, and read from there while that is up to date
+    """
+    if path.endswith(".npz"):
+        npzPath = path
+    else:
+        npzPath = path + ".npz"
+        if not os.path.exists(npzPath) or os.path.getmtime(npzPath) < os.path.getmtime(path + ".index"):
+            try:
+                convertCheckpoint(path, npzPath)
+            except (IOError, OSError):  # read-only directory: just use the checkpoint
+                return checkpointWeights(path)
+    with np.load(npzPath) as weights:
+        return dict((name, weights[name].astype(np.float32)) for name in WEIGHT_NAMES)
+
+
+def loadEvaluator(path="./model_ckpt400000", height=6, width=7):
+    """ A TDInference for the weights at 'path' (see loadWeights) """
+    return TDInference(loadWeights(path), height, width)
+
+
+class TDInference(object):
+    """ Play-time replacement for TemporalDifferenceLearner as a tdEvaluator: same input
+        encoding, same layers and the same float32 arithmetic, so forwardEvaluation agrees
+        with the learner's up to float rounding. Note the network adds each hidden bias
+        after its relu, as the learner's graph does.
+    """
+
+    def __init__(self, weights, height=6, width=7):
+        self.height = height
+        self.width = width
+        self.pieceToValue = {"R": 1.0, "B": -1.0, "O": 0.0}
+        self.weights = dict((name, np.asarray(weights[name], dtype=np.float32)) for name in WEIGHT_NAMES)
+        for name in WEIGHT_NAMES:
+            setattr(self, name, self.weights[name])
+
+    def getWeights(self):
+        """ Same as TemporalDifferenceLearner.getWeights """
+        return dict(self.weights)
+
+    def boardToMatrix(self, board):
+        arr = np.zeros((self.height, self.width), dtype=np.float32)
+        for row in range(self.height):
+            for col in range(self.width):
+                arr[self.height - 1 - row][col] = self.pieceToValue[board.columns[col][row]]
+        return arr
+
+    def boardToVec(self, board):
+        return self.boardToMatrix(board).reshape(1, self.height * self.width)
+
+    def childVecs(self, board, moves, color):
+        """ boardToVec of the board after each of 'moves' by color, one per row """
+        vecs = np.repeat(self.boardToVec(board), len(moves), axis=0)
+        for i, move in enumerate(moves):
+            row = board.columnFillHeights[move]
+            vecs[i][(self.height - 1 - row) * self.width + move] = self.pieceToValue[color]
+        return vecs
+
+    def forwardEvaluation(self, boardVec):
+        """ Network values of the boards in the rows of boardVec, as an (N, 1) array """
+        hidden1 = np.maximum(np.asarray(boardVec, dtype=np.float32).dot(self.W1), 0) + self.b1
+        hidden2 = np.maximum(hidden1.dot(self.W2), 0) + self.b2
+        hidden3 = np.maximum(hidden2.dot(self.W3), 0) + self.b3
+        return hidden3.dot(self.W4) + self.b4
+
+    def evaluateBoard(self, board):
+        """ Network value of a single board, from red's perspective """
+        return float(self.forwardEvaluation(self.boardToVec(board))[0, 0])
@@ -6,6 +6,9 @@ import copy
 from connect_four import ConnectFourGame
 from player import HumanPlayer
 from board import ConnectFourBoard
+from self_play import SelfPlayEnv, tdExamples, explorationRate, gameResults
+from replay_buffer import ReplayBuffer
+from actor_learner import ActorPool
 
 
 class TemporalDifferenceLearner(object):
@@ -24,6 +27,7 @@ class TemporalDifferenceLearner(object):
 		self.trainMode = False 
 		self.pieceToValue = {"R": 1.0, "B": -1.0, "O": 0.0}
 		self.results = {"R": 0, "B": 0, "Draw": 0}
+		self.samplesDue = 0.0  # replayed positions owed to the replay ratio (see _replayTrain)
 
 		if linearModel:
 			self.linearWeights = np.random.normal(
@@ -56,20 +60,27 @@ class TemporalDifferenceLearner(object):
 		self.b4 = tf.get_variable("b4", [1])
 
 	def setupNetworkGraph(self):
-		self.boardVec = tf.placeholder(tf.float32, shape=(1, 42))
+		self.boardVec = tf.placeholder(tf.float32, shape=(None, 42))  # one board per row
 		self.target = tf.placeholder(tf.float32, shape=None)
 		hidden1 = tf.nn.relu(tf.matmul(self.boardVec, self.W1)) + self.b1
 		hidden2 = tf.nn.relu(tf.matmul(hidden1, self.W2)) + self.b2
 		hidden3 = tf.nn.relu(tf.matmul(hidden2, self.W3)) + self.b3
 		self.evaluation = tf.matmul(hidden3, self.W4) + self.b4 
-		self.loss = 0.5 * (self.evaluation - self.target) ** 2.0
+		# mean over the examples fed, so a step is the same size whatever the batch size
+		self.loss = tf.reduce_mean(0.5 * (self.evaluation - self.target) ** 2.0)
 
 	def setupTrainStep(self):
 		self.trainStep = tf.train.AdamOptimizer(self.lr).minimize(self.loss)
 
 	def forwardEvaluation(self, boardVec):
+		"""Network values of the boards in the rows of boardVec, as an (N, 1) array."""
 		return self.sess.run(self.evaluation, feed_dict={self.boardVec: boardVec})
 
+	def getWeights(self):
+		"""Current network parameters as a dict of numpy arrays, keyed by variable name."""
+		return self.sess.run({"W1": self.W1, "b1": self.b1, "W2": self.W2, "b2": self.b2,
+			"W3": self.W3, "b3": self.b3, "W4": self.W4, "b4": self.b4})
+
 	def backPropagate(self, boardVec, target, endOfGame=False):
 		#print("Target: ", target)
 		#print("Value: ", self.forwardEvaluation(boardVec))  # TEST
@@ -92,6 +103,14 @@ class TemporalDifferenceLearner(object):
 
 	def boardToVec(self, board):
 		return self.boardToMatrix(board).reshape(1, 42)
+
+	def childVecs(self, board, moves, color):
+		"""boardToVec of the board after each of 'moves' by color, one per row, without playing them."""
+		vecs = np.repeat(self.boardToVec(board), len(moves), axis=0)
+		for i, move in enumerate(moves):
+			row = board.columnFillHeights[move]
+			vecs[i][(self.height-1-row) * self.width + move] = self.pieceToValue[color]
+		return vecs
 		
 	def evaluateBoard(self):
 		# return np.sum(self.linearWeights * boardMatrix) / 42.0 # TODO - replace with deep convolutional network
@@ -116,20 +135,13 @@ class TemporalDifferenceLearner(object):
 			self.board.undoMove()
 			return randomMove, randomValue 
 
-		# Reflex policy
-		bestMove = None
-		bestValue = -float("inf") if color == "R" else float("inf")  # Red maximizes, black minimizes value
-		for move in legalMoves:
-			self.board.addPiece(move, color)
-			value = self.evaluateBoard()
-			if (value > bestValue and color == "R") or (value < bestValue and color == "B"):
-				bestValue = value 
-				bestMove = move 
-			self.board.undoMove()  # important! This undoes scratch work done by looking ahead
-		return bestMove, bestValue
+		# Reflex policy: every legal move is scored in one forward pass
+		values = self.forwardEvaluation(self.childVecs(self.board, legalMoves, color))
+		best = np.argmax(values[:, 0]) if color == "R" else np.argmin(values[:, 0])  # Red maximizes, black minimizes value
+		return legalMoves[best], values[best:best+1]
 
 	def makeMove(self, color, epsilon): 	
-		winner = self.board.containsFourInARow()
+		winner = self.board.getLastMoveWinner()
 		if winner:
 			target = 10.0 if winner == "R" else -12.0
 			self.gameIsOver = True
@@ -170,10 +182,93 @@ class TemporalDifferenceLearner(object):
 				# print "Weights: ", self.linearWeights
 				print("Results: ", self.results)
 			self.trainIter = it 
-			epsilon = 0.05 if it < 40000 else max(0, 0.04 - it / (3.0 * 1e6))
-			self.playVirtualGame(epsilon=epsilon)   # anneals epsilon based on iteration
+			self.playVirtualGame(epsilon=explorationRate(it))   # anneals epsilon based on iteration
 		savePath = self.saveModel(path="./model_ckpt" + str(endIter))
 	
+	def trainBatched(self, startIter=0, endIter=20000, batchSize=64, replaySize=None, minibatchSize=256, replayRatio=4.0):
+		"""Same as train, but plays batchSize self-play games at once (see self_play.SelfPlayEnv)
+		and takes one train step per ply on all of their positions. The targets are makeMove's: the
+		reward for a position that ends a game, counted 5 times as makeMove trains on it 5 times,
+		and gamma times its value for the others (see self_play.tdExamples).
+		With replaySize, the positions go into a ReplayBuffer holding the latest replaySize of them
+		instead, and each ply takes as many train steps on random minibatches of minibatchSize as
+		needed to sample replayRatio positions per position added. Targets are computed when a
+		position is played, so replayed ones come from a slightly older network."""
+		self.trainMode = True
+		if startIter == 0:
+			self.results = {"R": 0, "B": 0, "Draw": 0}
+		env = SelfPlayEnv(batchSize, self.height, self.width)
+		replay = None if replaySize is None else ReplayBuffer(replaySize, self.height * self.width)
+		self.samplesDue = 0.0
+		it = startIter
+		nextReport = startIter
+		while it < endIter:
+			if it >= nextReport:
+				print("Results: ", self.results)
+				nextReport += 2000
+			self.trainIter = it
+			# Don't backprop until we see some rewards
+			inputs, targets, winners, full = tdExamples(env, self.forwardEvaluation, explorationRate(it), self.gamma, onlyEnded=(it <= 1000))
+			if len(inputs):
+				if replay is None:
+					self.trainStep.run(feed_dict={self.boardVec: inputs, self.target: targets.reshape(-1, 1)})
+				else:
+					self._replayTrain(replay, inputs, targets, minibatchSize, replayRatio)
+			it += self._addResults(gameResults(winners, full))
+		print("Results: ", self.results)
+		savePath = self.saveModel(path="./model_ckpt" + str(endIter))
+
+	def trainParallel(self, startIter=0, endIter=20000, numActors=4, syncInterval=20, actorBatchSize=64, chunkPlies=8, replaySize=200000, minibatchSize=256, replayRatio=4.0):
+		"""Same as trainBatched with a replay buffer, but the games are played by numActors processes
+		(see actor_learner.ActorPool), each with actorBatchSize games at a time on a NumPy copy of the
+		network, while this process only takes train steps on what they send. The actors' copy is
+		refreshed every syncInterval train steps. endIter counts the games received from the actors."""
+		self.trainMode = True
+		if startIter == 0:
+			self.results = {"R": 0, "B": 0, "Draw": 0}
+		replay = ReplayBuffer(replaySize, self.height * self.width)
+		it, nextReport = startIter, startIter
+		self.samplesDue = 0.0
+		steps = 0
+		with ActorPool(self.getWeights(), numActors, actorBatchSize, chunkPlies, self.gamma, self.height, self.width, gamesPlayed=startIter) as actors:
+			while it < endIter:
+				if it >= nextReport:
+					print("Iteration: ", it)
+					print("Results: ", self.results)
+					nextReport += 2000
+				self.trainIter = it
+				inputs, targets, results, version = actors.get()
+				if len(inputs):
+					taken = self._replayTrain(replay, inputs, targets, minibatchSize, replayRatio)
+					if (steps + taken) // syncInterval > steps // syncInterval:
+						actors.publish(self.getWeights())
+					steps += taken
+				it += self._addResults(results)
+		print("Results: ", self.results)
+		savePath = self.saveModel(path="./model_ckpt" + str(endIter))
+
+	def _replayTrain(self, replay, inputs, targets, minibatchSize, replayRatio):
+		"""Adds inputs and targets to replay, then takes train steps on random minibatches of
+		minibatchSize for as long as fewer than replayRatio positions have been sampled per
+		position added. Nothing is sampled until replay holds a minibatch. The positions still
+		owed carry over to the next call in self.samplesDue. Returns the number of steps taken."""
+		replay.add(inputs, targets)
+		if len(replay) >= minibatchSize:
+			self.samplesDue += replayRatio * len(inputs)
+		steps = 0
+		while self.samplesDue >= minibatchSize:
+			boardVecs, batchTargets = replay.sample(minibatchSize)
+			self.trainStep.run(feed_dict={self.boardVec: boardVecs, self.target: batchTargets})
+			self.samplesDue -= minibatchSize
+			steps += 1
+		return steps
+
+	def _addResults(self, results):
+		"""Adds a {"R", "B", "Draw"} count of finished games to self.results and returns how many there were."""
+		for result, games in results.items():
+			self.results[result] += games
+		return sum(results.values())
+
 	def saveModel(self, path="model_ckpt"):
 		return self.saver.save(self.sess, path)
 
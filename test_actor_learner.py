@@ -0,0 +1,31 @@
+import numpy as np
+
+from actor_learner import ActorPool, SharedWeights
+from td_inference import checkpointWeights, WEIGHT_NAMES
+
+
+def test_shared_weights_publish_and_read():
+    weights = checkpointWeights("./model_ckpt400000")
+    shared = SharedWeights(weights)
+    version, read = shared.read()
+    assert version == shared.version == 1
+    for name in WEIGHT_NAMES:
+        assert read[name].shape == weights[name].shape and np.array_equal(read[name], weights[name])
+    shared.publish(dict((name, weights[name] + 1) for name in WEIGHT_NAMES))
+    version, read = shared.read()
+    assert version == 2 and np.array_equal(read["W2"], weights["W2"] + 1)
+
+
+def test_actors_stream_games_and_pick_up_new_weights():
+    weights = checkpointWeights("./model_ckpt400000")
+    with ActorPool(weights, numActors=2, batchSize=8, chunkPlies=4, gamesPlayed=2000, seed=0) as actors:
+        assert actors.context.get_start_method() == "spawn"
+        inputs, targets, results, version = actors.get(timeout=30)
+        assert inputs.shape == (len(targets), 42) and len(targets) >= 8 * 4
+        assert version == 1 and set(results) == set(["R", "B", "Draw"])
+        actors.publish(dict(weights, W4=-weights["W4"], b4=-weights["b4"]))
+        while version == 1:
+            inputs, targets, results, version = actors.get(timeout=30)
+        assert version == 2
+    assert all(not process.is_alive() for process in actors.processes)
+    assert actors.gamesPlayed.value > 2000
@@ -0,0 +1,69 @@
+import time
+
+import pytest
+
+from agent import ConnectFourAgent
+from minimax import Minimax, SearchTimeout
+from test_transposition import RootValues, randomPositions
+
+
+def boardState(board):
+    return (board.redBits, board.blackBits, board.hashKey, list(board.moves), board.getNumMoves())
+
+
+def test_timed_out_search_leaves_board_untouched():
+    for board, color in randomPositions(seed=31, count=5, minMoves=2, maxMoves=10):
+        before = boardState(board)
+        for alpha_beta in (False, True):
+            engine = Minimax("simple")
+            with pytest.raises(SearchTimeout):
+                engine.bestMove(6, board, color, alpha_beta, deadline=time.time() - 1)
+            assert boardState(board) == before
+            assert engine.deadline is None
+            # the engine is still usable afterwards
+            assert engine.bestMove(2, board, color, alpha_beta) in board.getLegalMoves()
+
+
+def test_first_move_is_searched_first():
+    for board, color in randomPositions(seed=32, count=5, minMoves=2, maxMoves=10):
+        plain = RootValues("simple")
+        plain.bestMove(2, board, color, True)
+        for first_move in board.getLegalMoves():
+            engine = RootValues("simple")
+            engine.bestMove(2, board, color, True, first_move=first_move)
+            assert list(engine.values)[0] == first_move
+            assert engine.values == plain.values
+
+
+def test_iterative_deepening_plays_the_last_completed_depth():
+    board, color = next(randomPositions(seed=33, count=1, minMoves=4, maxMoves=4))
+    before = boardState(board)
+    moves = {1: 0, 2: 6, 3: 2}
+    for algorithm, first_moves in (("alphabeta", [None, 0, 6, 2]), ("minimax", [None] * 4)):
+        agent = ConnectFourAgent(color=color, algorithm=algorithm, time_limit_ms=60000)
+        calls = []
+
+        def searchToDepth(searchBoard, depth, deadline=None, first_move=None):
+            calls.append((depth, deadline is None, first_move))
+            if depth == 4:
+                raise SearchTimeout()
+            return moves[depth]
+
+        agent.searchToDepth = searchToDepth
+        assert agent.getMove(board) == 2
+        assert agent.completed_depth == 3
+        # depth 1 runs without a deadline, and alpha-beta starts each depth from the previous depth's move
+        assert calls == [(1, True, first_moves[0]), (2, False, first_moves[1]),
+                         (3, False, first_moves[2]), (4, False, first_moves[3])]
+        assert boardState(board) == before
+
+
+def test_iterative_deepening_plays_a_legal_move_in_time():
+    for board, color in randomPositions(seed=34, count=3, minMoves=4, maxMoves=10):
+        before = boardState(board)
+        agent = ConnectFourAgent(color=color, algorithm="alphabeta", time_limit_ms=200)
+        start = time.time()
+        move = agent.getMove(board)
+        assert time.time() - start < 1.0
+        assert move in board.getLegalMoves() and agent.completed_depth >= 1
+        assert boardState(board) == before
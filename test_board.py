@@ -0,0 +1,54 @@
+import random
+
+from board import ConnectFourBoard
+
+
+def scanForWinner(board):
+	"""The original string-scanning win check, kept as a reference for the bitboards."""
+	for line in board.columns + board.getRows() + board.getDiagonals():
+		winningColor = board.scan(line)
+		if winningColor is not None: return winningColor
+	return None
+
+
+def playRandomGame(board, rng):
+	color = "R"
+	while not board.isFull():
+		board.addPiece(rng.choice(board.getLegalMoves()), color)
+		yield
+		color = "B" if color == "R" else "R"
+
+
+def test_bitboard_win_detection_matches_scan():
+	rng = random.Random(0)
+	for height, width, connectK in [(6, 7, 4), (4, 4, 3), (5, 6, 4), (7, 9, 5), (3, 8, 2)]:
+		for game in range(50):
+			board = ConnectFourBoard(height, width, connectK)
+			for _ in playRandomGame(board, rng):
+				winner = scanForWinner(board)
+				assert board.containsFourInARow() == winner
+				if winner is not None: break
+
+
+def test_last_move_winner_matches_full_check():
+	rng = random.Random(2)
+	for height, width, connectK in [(6, 7, 4), (4, 4, 3), (7, 9, 5), (3, 8, 2)]:
+		for game in range(50):
+			board = ConnectFourBoard(height, width, connectK)
+			for _ in playRandomGame(board, rng):
+				winner = board.containsFourInARow()
+				assert board.getLastMoveWinner() == winner
+				if winner is not None: break
+
+
+def test_undo_restores_bitboards():
+	rng = random.Random(1)
+	board = ConnectFourBoard()
+	snapshots = []
+	for _ in playRandomGame(board, rng):
+		snapshots.append((board.redBits, board.blackBits, board.getLegalMoves()))
+	while snapshots:
+		assert (board.redBits, board.blackBits, board.getLegalMoves()) == snapshots.pop()
+		board.undoMove()
+	assert board.redBits == board.blackBits == 0
+	assert board.getLegalMoves() == list(range(board.width))
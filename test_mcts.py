@@ -0,0 +1,410 @@
+import random
+import time
+
+import mcts
+
+
+def almostFullPosition(game, seed):
+    """ Returns (state, player to move) reached by random play, with one slot left and no winner """
+    rng = random.Random(seed)
+    while True:
+        state, player = game.initial_state(), game.players[0]
+        for move in range(game.width * game.height - 1):
+            if game.terminal(state):
+                break
+            state = game.result(state, rng.choice(game.actions(state)), player)
+            player = game.next_player(player)
+        else:
+            if not game.terminal(state):
+                return state, player
+
+
+def test_bitboard_game_matches_tuple_game():
+    rng = random.Random(0)
+    for height, width, target in ((6, 7, 4), (4, 4, 3), (5, 6, 4)):
+        tuples = mcts.ConnectFour(height=height, width=width, target=target)
+        bits = mcts.BitboardConnectFour(height=height, width=width, target=target)
+        for game in range(50):
+            tuple_state, bit_state = tuples.initial_state(), bits.initial_state()
+            player = tuples.players[0]
+            while True:
+                assert bits.from_columns(tuple_state) == bit_state
+                assert bits.actions(bit_state) == tuples.actions(tuple_state)
+                assert bits.terminal(bit_state) == tuples.terminal(tuple_state)
+                for p in tuples.players:
+                    assert bits.outcome(bit_state, p) == tuples.outcome(tuple_state, p)
+                if tuples.terminal(tuple_state):
+                    break
+                action = rng.choice(tuples.actions(tuple_state))
+                tuple_state = tuples.result(tuple_state, action, player)
+                bit_state = bits.result(bit_state, action, player)
+                player = tuples.next_player(player)
+            assert bits.pretty_state(bit_state) == tuples.pretty_state(tuple_state)
+
+
+def test_mcts_uct_takes_an_immediate_win():
+    game = mcts.BitboardConnectFour(height=6, width=7, target=4)
+    state = game.initial_state()
+    for action, player in ((0, 1), (6, 2), (1, 1), (6, 2), (2, 1), (5, 2)):
+        state = game.result(state, action, player)
+    random.seed(0)
+    assert mcts.mcts_uct(game, state, 1, 500) == 3
+
+
+def test_playout_kernel_agrees_with_generic_playout():
+    game = mcts.BitboardConnectFour(height=6, width=7, target=4)
+    state = game.initial_state()
+    for action, player in ((3, 1), (3, 2), (2, 1)):
+        state = game.result(state, action, player)
+    random.seed(1)
+    kernel = game.playout(state, 2, 1, 4000) / 4000.0
+    generic = mcts.Game.playout(game, state, 2, 1, 4000) / 4000.0
+    assert abs(kernel - generic) < 0.06
+
+
+def test_playout_kernel_forced_endings():
+    game = mcts.BitboardConnectFour(height=4, width=4, target=3)
+    # already won by player 1 on the bottom row
+    state = game.initial_state()
+    for action, player in ((0, 1), (0, 2), (1, 1), (1, 2), (2, 1)):
+        state = game.result(state, action, player)
+    assert game.playout(state, 2, 1, 10) == 10 * game.VALUE_WIN
+    assert game.playout(state, 2, 2, 10) == 10 * game.VALUE_LOSE
+    # only one slot left, so every playout ends the same way
+    state, player = almostFullPosition(game, 3)
+    final = game.result(state, game.actions(state)[0], player)
+    assert game.playout(state, player, 1, 5) == 5 * game.outcome(final, 1)
+
+
+def test_winning_slots_complete_a_line():
+    rng = random.Random(9)
+    for height, width, target in ((6, 7, 4), (4, 5, 3)):
+        game = mcts.BitboardConnectFour(height=height, width=width, target=target)
+        for _ in range(100):
+            state, player = game.initial_state(), game.players[0]
+            for move in range(rng.randint(0, height * width)):
+                if game.terminal(state):
+                    break
+                state = game.result(state, rng.choice(game.actions(state)), player)
+                player = game.next_player(player)
+            for bits in state:
+                if game._won(bits):
+                    continue
+                expected = 0
+                for column in range(width):
+                    for row in range(height):
+                        slot = 1 << (column * game.stride + row)
+                        if not bits & slot and game._won(bits | slot):
+                            expected |= slot
+                assert game.winning_slots(bits) == expected
+
+
+def test_heuristic_rollout_wins_and_blocks():
+    game = mcts.BitboardConnectFour(height=6, width=7, target=4)
+    rollout = mcts.HeuristicRollout()
+    # player 1 to move can complete the bottom row at column 3
+    state = game.initial_state()
+    for action, player in ((0, 1), (6, 2), (1, 1), (6, 2), (2, 1), (5, 2)):
+        state = game.result(state, action, player)
+    assert rollout.playout(game, state, 1, 1, 20) == 20 * game.VALUE_WIN
+    # player 2 threatens both ends of the bottom row: blocking one loses at the other
+    state = game.initial_state()
+    for action, player in ((1, 2), (1, 1), (2, 2), (2, 1), (3, 2), (6, 1)):
+        state = game.result(state, action, player)
+    assert rollout.playout(game, state, 1, 1, 20) == 20 * game.VALUE_LOSE
+    # without win/block and center bias it is the uniform policy
+    state = game.initial_state()
+    for action, player in ((3, 1), (3, 2), (2, 1)):
+        state = game.result(state, action, player)
+    random.seed(2)
+    uniform = mcts.HeuristicRollout(win_block=False, center_bias=0).playout(game, state, 2, 1, 4000) / 4000.0
+    kernel = game.playout(state, 2, 1, 4000) / 4000.0
+    assert abs(uniform - kernel) < 0.06
+
+
+def test_progressive_bias_rates_each_new_child():
+    game = mcts.BitboardConnectFour(height=6, width=7, target=4)
+    prior = mcts.HeuristicPrior()
+    tree = mcts.Tree(game, game.initial_state(), 1, prior=prior, bias_weight=2.0)
+    random.seed(3)
+    mcts.mcts_uct(game, tree.state, 1, 300, tree=tree, rollout=mcts.HeuristicRollout())
+    stack = [(0, tree.state, 1)]
+    while stack:
+        node, state, player = stack.pop()
+        for child in tree.children(node):
+            child_state = game.result(state, tree.action[child], player)
+            assert abs(tree.bias[child] - prior(game, child_state, player)) < 1e-6
+            stack.append((child, child_state, game.next_player(player)))
+    subtree = tree.subtree(3)
+    assert subtree.prior is prior and subtree.bias_weight == 2.0
+    # among children with equal statistics the one the prior likes best is picked
+    ratings = dict((tree.action[child], tree.bias[child]) for child in tree.children(0))
+    for child in tree.children(0):
+        tree.visits[child], tree.value[child] = 10, 0.0
+    assert tree.action[tree.best_child(0)] == max(ratings, key=ratings.get)
+
+
+def test_td_prior_is_the_network_value_for_the_mover():
+    from board import ConnectFourBoard
+    from td_inference import checkpointWeights, TDInference
+    weights = checkpointWeights("./model_ckpt400000")
+    network = TDInference(weights)
+    prior = mcts.TDPrior(weights, 6, 7)
+    game = mcts.BitboardConnectFour(height=6, width=7, target=4)
+    state, player = game.initial_state(), game.players[0]
+    board = ConnectFourBoard()
+    rng = random.Random(13)
+    for move in range(12):
+        action = rng.choice(game.actions(state))
+        state = game.result(state, action, player)
+        board.addPiece(action, "R" if player == game.players[0] else "B")
+        red = max(-1.0, min(1.0, float(network.evaluateBoard(board))))
+        expected = red if player == game.players[0] else -red
+        assert abs(prior(game, state, player) - expected) < 1e-5
+        player = game.next_player(player)
+    try:
+        mcts.TDPrior(weights, 4, 4)
+    except ValueError:
+        pass
+    else:
+        assert False, "a 4x4 board should not fit the 42-input network"
+
+
+def test_player_with_td_prior():
+    from board import ConnectFourBoard
+    from player import MctsPlayer
+    from td_inference import checkpointWeights
+    player = MctsPlayer(color="R", budget=50, prior="td", td_weights=checkpointWeights("./model_ckpt400000"))
+    board = ConnectFourBoard()
+    move = player.getMove(board)
+    assert move in board.getLegalMoves()
+    assert player.last_stats['iterations'] > 0
+
+
+def test_mcts_uct_blocks_an_immediate_loss():
+    game = mcts.BitboardConnectFour(height=6, width=7, target=4)
+    state = game.initial_state()
+    # player 2 threatens to complete the bottom row at column 3
+    for action, player in ((0, 2), (6, 1), (1, 2), (6, 1), (2, 2), (5, 1)):
+        state = game.result(state, action, player)
+    random.seed(0)
+    assert mcts.mcts_uct(game, state, 1, 2000) == 3
+    # and so do the guided policies, on a smaller budget
+    assert mcts.mcts_uct(game, state, 1, 300, rollout=mcts.HeuristicRollout(), prior=mcts.HeuristicPrior()) == 3
+
+
+def test_tree_bookkeeping():
+    game = mcts.BitboardConnectFour(height=4, width=4, target=3)
+    tree = mcts.Tree(game, game.initial_state(), 1, capacity=4)
+    random.seed(0)
+    for _ in range(300):
+        node, state, player, depth = tree.select()
+        tree.backup(node, tree.simulate(node, state, player, depth, 2), depth, 2)
+    assert len(tree) <= 301 and tree.capacity >= len(tree)
+    assert tree.visits[0] == 600
+    for node in range(len(tree)):
+        children = list(tree.children(node))
+        assert len(children) == tree.expanded[node]
+        if children and tree.proven[node] == tree.UNPROVEN:
+            # every visit to an internal node but its own first playout went to one of its children
+            assert sum(tree.visits[child] for child in children) == tree.visits[node] - (2 if node else 0)
+    assert mcts.Tree.bytes_per_node() < 64
+
+
+def test_subtree_keeps_the_statistics_below_the_move():
+    game = mcts.BitboardConnectFour(height=6, width=7, target=4)
+    tree = mcts.Tree(game, game.initial_state(), 1)
+    random.seed(4)
+    mcts.mcts_uct(game, tree.state, 1, 1000, tree=tree)
+    child = [node for node in tree.children(0) if tree.action[node] == 3][0]
+    subtree = tree.subtree(3)
+    assert subtree.state == game.result(tree.state, 3, 1) and subtree.player == 2
+    assert subtree.visits[0] == tree.visits[child] and subtree.value[0] == tree.value[child]
+    old = sorted((tree.action[node], tree.visits[node], tree.value[node]) for node in tree.children(child))
+    new = sorted((subtree.action[node], subtree.visits[node], subtree.value[node]) for node in subtree.children(0))
+    assert old == new
+    assert subtree.parent[0] == subtree.NO_NODE and subtree.next_sibling[0] == subtree.NO_NODE
+    assert all(subtree.parent[node] < node for node in range(1, len(subtree)))
+    # the search carries on from the kept statistics
+    before = subtree.visits[0]
+    mcts.mcts_uct(game, subtree.state, 2, 200, tree=subtree)
+    assert subtree.visits[0] == before + 200
+
+
+def test_tree_memory_cap():
+    game = mcts.BitboardConnectFour(height=6, width=7, target=4)
+    tree = mcts.Tree(game, game.initial_state(), 1, capacity=16, max_nodes=100)
+    random.seed(5)
+    mcts.mcts_uct(game, tree.state, 1, 500, tree=tree)
+    assert len(tree) == 100 and tree.capacity == 100
+    assert tree.visits[0] == 500
+
+
+def test_parallel_modes_block_an_immediate_loss():
+    game = mcts.BitboardConnectFour(height=6, width=7, target=4)
+    state = game.initial_state()
+    for action, player in ((0, 2), (6, 1), (1, 2), (6, 1), (2, 2), (5, 1)):
+        state = game.result(state, action, player)
+    for mode in ('root', 'tree'):
+        random.seed(0)
+        assert mcts.mcts_uct_parallel(game, state, 1, 500, 2, mode) == 3
+
+
+def test_player_closes_its_worker_pool():
+    from board import ConnectFourBoard
+    from player import MctsPlayer
+    with MctsPlayer(color="R", budget=50, workers=2) as player:
+        player.getMove(ConnectFourBoard())
+        workers = list(player.pool._pool)
+        assert workers and all(worker.is_alive() for worker in workers)
+        player.reset()
+        assert player.pool is None and not any(worker.is_alive() for worker in workers)
+        player.getMove(ConnectFourBoard())
+        workers = list(player.pool._pool)
+    assert player.pool is None and not any(worker.is_alive() for worker in workers)
+
+
+def test_virtual_loss_is_taken_back():
+    game = mcts.BitboardConnectFour(height=4, width=4, target=3)
+    tree = mcts.SharedTree(game, game.initial_state(), 1, 201)
+    iterations = mcts.multiprocessing.Value('i', 200)
+    mcts._tree_parallel_worker(tree, 1, iterations, 1, 3, 0)
+    assert len(tree) <= 201 and tree.visits[0] == 200
+    for node in range(1, len(tree)):
+        children = list(tree.children(node))
+        if children:
+            assert sum(tree.visits[child] for child in children) == tree.visits[node] - 1
+        assert -tree.visits[node] <= tree.value[node] <= tree.visits[node]
+
+
+def test_search_respects_a_time_limit():
+    game = mcts.BitboardConnectFour(height=6, width=7, target=4)
+    search = mcts.MctsSearch(game, game.initial_state(), 1)
+    random.seed(6)
+    start = time.time()
+    action = search.run(time_limit=0.2, early_stop=False)
+    assert time.time() - start < 0.5
+    stats = search.stats()
+    assert action == stats['best_action'] == search.best_action()
+    assert stats['iterations'] > 0 and stats['playouts'] == stats['iterations']
+    assert stats['tree_size'] == len(search.tree) and stats['playouts_per_second'] > 0
+    # anytime: the search can be resumed
+    search.run(budget=100, early_stop=False)
+    assert search.stats()['iterations'] == stats['iterations'] + 100
+
+
+def test_search_stops_early_when_the_move_is_decided():
+    game = mcts.BitboardConnectFour(height=6, width=7, target=4)
+    state = game.initial_state()
+    for action, player in ((0, 1), (6, 2), (1, 1), (6, 2), (2, 1), (5, 2)):
+        state = game.result(state, action, player)
+    random.seed(7)
+    search = mcts.MctsSearch(game, state, 1)
+    assert search.run(budget=20000) == 3
+    assert search.stopped_early and search.iterations < 20000
+    # every move but the block loses at once: once those are proven the block is the only move left
+    state = game.initial_state()
+    for action, player in ((0, 2), (6, 1), (1, 2), (6, 1), (2, 2), (5, 1)):
+        state = game.result(state, action, player)
+    random.seed(8)
+    search = mcts.MctsSearch(game, state, 1)
+    assert search.run(budget=20000) == 3
+    assert search.stopped_early and search.iterations < 1000
+    # a single legal move is decided as soon as it is expanded
+    small = mcts.BitboardConnectFour(height=4, width=4, target=3)
+    state, player = almostFullPosition(small, 8)
+    search = mcts.MctsSearch(small, state, player)
+    assert search.run(budget=50) == small.actions(state)[0] and search.iterations == 1
+
+
+def negamax(game, state, player, memo):
+    """ Exact value of state for player, the player to move """
+    if (state, player) not in memo:
+        if game.terminal(state):
+            value = game.outcome(state, player)
+        else:
+            opponent = game.next_player(player)
+            value = max(-negamax(game, game.result(state, action, player), opponent, memo)
+                        for action in game.actions(state))
+        memo[(state, player)] = value
+    return memo[(state, player)]
+
+
+def test_solver_proves_exact_values():
+    game = mcts.BitboardConnectFour(height=4, width=4, target=3)
+    rng = random.Random(9)
+    memo = {}
+    for trial in range(15):
+        state, player = game.initial_state(), game.players[0]
+        for move in range(rng.randint(4, 9)):
+            if game.terminal(state):
+                break
+            state = game.result(state, rng.choice(game.actions(state)), player)
+            player = game.next_player(player)
+        if game.terminal(state):
+            continue
+        random.seed(trial)
+        search = mcts.MctsSearch(game, state, player)
+        action = search.run(budget=20000, early_stop=False)  # until the root is proven
+        tree = search.tree
+        assert tree.proven[0] != tree.UNPROVEN
+        value = negamax(game, state, player, memo)
+        assert -tree.proven[0] == value
+        # the chosen move keeps the exact value
+        assert -negamax(game, game.result(state, action, player), game.next_player(player), memo) == value
+        for node in tree.children(0):
+            if tree.proven[node] != tree.UNPROVEN:
+                child = game.result(state, tree.action[node], player)
+                assert tree.proven[node] == -negamax(game, child, game.next_player(player), memo)
+
+
+def test_position_keys_round_trip():
+    game = mcts.BitboardConnectFour(height=6, width=7, target=4)
+    rng = random.Random(10)
+    for trial in range(100):
+        state, player = game.initial_state(), 1
+        while not game.terminal(state):
+            assert game.from_key(game.key(state)) == state
+            state = game.result(state, rng.choice(game.actions(state)), player)
+            player = game.next_player(player)
+        assert game.from_key(game.key(state)) == state
+
+
+def test_solve_matches_negamax():
+    game = mcts.BitboardConnectFour()
+    memo = {}
+    solution = mcts.solve(game, game.initial_state(), 1)
+    assert solution.value == negamax(game, game.initial_state(), 1, memo)
+    assert solution.positions == len(memo)
+    rng = random.Random(11)
+    for trial in range(10):
+        state, player = game.initial_state(), game.players[0]
+        for move in range(rng.randint(1, 8)):
+            if game.terminal(state):
+                break
+            state = game.result(state, rng.choice(game.actions(state)), player)
+            player = game.next_player(player)
+        solution = mcts.solve(game, state, player)
+        assert solution.value == negamax(game, state, player, memo)
+        for action, value in solution.action_values.items():
+            assert value == -negamax(game, game.result(state, action, player), game.next_player(player), memo)
+    # tuple-state games are solved on bitboards
+    tuples = mcts.ConnectFour()
+    assert mcts.solve(tuples, tuples.initial_state(), 2).value == negamax(game, game.initial_state(), 2, memo)
+
+
+def test_solve_larger_boards_in_small_chunks():
+    game = mcts.BitboardConnectFour(height=5, width=4, target=4)
+    rng = random.Random(12)
+    memo = {}
+    for trial in range(3):
+        state, player = game.initial_state(), game.players[0]
+        for move in range(6):
+            state = game.result(state, rng.choice(game.actions(state)), player)
+            player = game.next_player(player)
+        # layers of thousands of positions are sorted in many runs and merged
+        solution = mcts.solve(game, state, player, chunk_keys=1000)
+        assert solution.value == negamax(game, state, player, memo)
+        for action, value in solution.action_values.items():
+            assert value == -negamax(game, game.result(state, action, player), game.next_player(player), memo)
+        assert solution == mcts.solve(game, state, player)
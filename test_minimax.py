@@ -0,0 +1,100 @@
+import random
+
+from board import ConnectFourBoard
+from minimax import Minimax
+from evaluation import getPatternEvaluator, IncrementalEvaluator
+
+
+def randomPositions(seed, count, minMoves=0, maxMoves=20):
+    """ Yields (board, color to move) pairs reached by random play, none of them won yet """
+    rng = random.Random(seed)
+    while count > 0:
+        board = ConnectFourBoard()
+        color = "R"
+        for i in range(rng.randint(minMoves, maxMoves)):
+            board.addPiece(rng.choice(board.getLegalMoves()), color)
+            color = "B" if color == "R" else "R"
+            if board.getLastMoveWinner() is not None:
+                break
+        if board.containsFourInARow() is None and not board.isFull():
+            count -= 1
+            yield board, color
+
+
+def test_pvs_move_values_match_full_minimax():
+    for evalfn in ("simple", "complex"):
+        for depth in (1, 2, 3, 4):
+            for board, color in randomPositions(seed=depth, count=12):
+                full = Minimax(evalfn).moveValues(depth, board, color)
+                pvs = Minimax(evalfn).moveValues(depth, board, color, alpha_beta=True)
+                assert pvs == full
+
+
+def test_pvs_visits_fewer_nodes():
+    full_nodes = pvs_nodes = 0
+    for board, color in randomPositions(seed=99, count=5, minMoves=4, maxMoves=10):
+        engine = Minimax("simple")
+        engine.moveValues(4, board, color)
+        full_nodes += engine.nodes
+        engine = Minimax("simple")
+        engine.moveValues(4, board, color, alpha_beta=True)
+        pvs_nodes += engine.nodes
+    assert pvs_nodes * 3 < full_nodes
+
+
+def test_search_leaves_board_untouched():
+    for board, color in randomPositions(seed=5, count=5):
+        before = (board.redBits, board.blackBits, board.hashKey, list(board.moves))
+        Minimax("simple").bestMove(3, board, color, alpha_beta=True)
+        Minimax("simple").bestMove(2, board, color)
+        assert (board.redBits, board.blackBits, board.hashKey, list(board.moves)) == before
+
+
+def test_pattern_evaluator_matches_streak_counting():
+    rng = random.Random(42)
+    engine = Minimax("simple")
+    evaluator = getPatternEvaluator(6, 7, 4)
+    for game in range(30):
+        board = ConnectFourBoard()
+        color = "R"
+        while not board.isFull():
+            board.addPiece(rng.choice(board.getLegalMoves()), color)
+            color = "B" if color == "R" else "R"
+            state = board.getState2dArray()
+            for side in ("R", "B"):
+                assert evaluator.value0(board, side) == engine.value0(state, side)
+                assert evaluator.value(board, side) == engine.value(state, side)
+            # half the games keep going after a win, so won and full boards are covered too
+            if game % 2 == 0 and board.getLastMoveWinner() is not None:
+                break
+
+
+def test_incremental_evaluator_tracks_make_and_unmake():
+    rng = random.Random(7)
+    evaluator = getPatternEvaluator(6, 7, 4)
+    for board, color in randomPositions(seed=11, count=20, maxMoves=10):
+        incremental = IncrementalEvaluator()
+        incremental.reset(board)
+        played = 0
+        for step in range(30):
+            if played > 0 and (board.isFull() or board.getLastMoveWinner() is not None or rng.random() < 0.3):
+                board.undoMove()
+                incremental.pieceRemoved(board)
+                played -= 1
+                color = "B" if color == "R" else "R"
+            else:
+                board.addPiece(rng.choice(board.getLegalMoves()), color)
+                incremental.pieceAdded(board)
+                played += 1
+                color = "B" if color == "R" else "R"
+                assert incremental.lastMoveWon(board) == (board.getLastMoveWinner() is not None)
+            for side in ("R", "B"):
+                assert incremental.value0(side) == evaluator.value0(board, side)
+
+
+def test_incremental_search_matches_full_evaluation():
+    for board, color in randomPositions(seed=13, count=8, minMoves=2, maxMoves=12):
+        full = Minimax("simple", incremental=False)
+        incremental = Minimax("simple")
+        assert incremental.moveValues(5, board, color, alpha_beta=True) == full.moveValues(5, board, color, alpha_beta=True)
+        assert incremental.nodes == full.nodes
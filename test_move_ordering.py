@@ -0,0 +1,48 @@
+from minimax import Minimax
+from move_ordering import MoveOrderer
+from test_transposition import RootValues, randomPositions
+
+
+def test_center_out_and_plain_order():
+    assert MoveOrderer().orderMoves(list(range(7)), 0, "R") == [3, 2, 4, 1, 5, 0, 6]
+    plain = MoveOrderer(center=False, ttMove=False, killers=False, history=False)
+    assert plain.orderMoves([6, 3, 0, 1], 0, "R", ttMove=6) == [0, 1, 3, 6]
+
+
+def test_tt_move_then_killers_then_history_then_center():
+    orderer = MoveOrderer()
+    orderer.recordCutoff(6, 2, 3, "R")
+    orderer.recordCutoff(0, 2, 1, "R")  # newest killer first
+    orderer.recordCutoff(5, 4, 2, "R")  # a killer at another ply only counts as history
+    orderer.recordCutoff(1, 4, 1, "B")  # history is kept per color
+    assert orderer.killers[2] == [0, 6]
+    assert orderer.history["R"] == [1, 0, 0, 0, 0, 4, 9]
+    moves = list(range(7))
+    assert orderer.orderMoves(moves, 2, "R", ttMove=2) == [2, 0, 6, 5, 3, 4, 1]
+    assert orderer.orderMoves(moves, 2, "R") == [0, 6, 5, 3, 2, 4, 1]
+    assert orderer.orderMoves(moves, 3, "R") == [6, 5, 0, 3, 2, 4, 1]
+    assert orderer.orderMoves(moves, 3, "B") == [1, 3, 2, 4, 5, 0, 6]
+    orderer.recordCutoff(4, 2, 1, "R")
+    assert orderer.killers[2] == [4, 0]  # only numKillers are kept
+
+
+def test_new_search_drops_killers_and_halves_history():
+    orderer = MoveOrderer()
+    orderer.recordCutoff(6, 2, 3, "R")
+    orderer.recordCutoff(5, 1, 2, "R")
+    orderer.newSearch()
+    assert orderer.killers == {}
+    assert orderer.history["R"] == [0, 0, 0, 0, 0, 2, 4]
+
+
+def test_ordering_searches_fewer_nodes_for_the_same_values():
+    plain_nodes = ordered_nodes = 0
+    for board, color in randomPositions(seed=41, count=6, minMoves=2, maxMoves=10):
+        plain = RootValues("simple", moveOrderer=MoveOrderer(center=False, ttMove=False, killers=False, history=False))
+        ordered = RootValues("simple")
+        plain.bestMove(6, board, color, True)
+        ordered.bestMove(6, board, color, True)
+        assert ordered.values == plain.values
+        plain_nodes += plain.nodes
+        ordered_nodes += ordered.nodes
+    assert ordered_nodes * 3 < plain_nodes * 2
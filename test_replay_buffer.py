@@ -0,0 +1,31 @@
+import numpy as np
+
+from replay_buffer import ReplayBuffer
+
+
+def positions(first, count):
+    """ Boards whose every entry is the position's number, with that number as the target """
+    numbers = np.arange(first, first + count, dtype=np.float32)
+    return np.repeat(numbers[:, None], 42, axis=1), numbers
+
+
+def test_buffer_keeps_the_latest_positions():
+    buffer = ReplayBuffer(10, seed=0)
+    buffer.add(*positions(0, 4))
+    assert len(buffer) == 4
+    buffer.add(*positions(4, 9))  # wraps around, overwriting positions 0-2
+    assert len(buffer) == 10 and buffer.next == 3
+    assert sorted(buffer.targets) == list(range(3, 13))
+    assert np.all(buffer.boards == buffer.targets[:, None])
+    buffer.add(*positions(13, 25))  # more than fits at once: only the last 10 are kept
+    assert sorted(buffer.targets) == list(range(28, 38))
+    assert np.all(buffer.boards == buffer.targets[:, None])
+
+
+def test_samples_come_from_the_stored_positions():
+    buffer = ReplayBuffer(100, seed=1)
+    buffer.add(*positions(0, 30))
+    boards, targets = buffer.sample(500)
+    assert boards.shape == (500, 42) and targets.shape == (500, 1)
+    assert np.all(boards == targets)
+    assert set(targets[:, 0]) == set(range(30))
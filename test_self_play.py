@@ -0,0 +1,105 @@
+import numpy as np
+
+from board import ConnectFourBoard
+from self_play import SelfPlayEnv, tdExamples, gameResults
+
+
+def boardMatrix(board):
+    """ TemporalDifferenceLearner.boardToMatrix """
+    values = {"R": 1.0, "B": -1.0, "O": 0.0}
+    arr = np.zeros((board.height, board.width))
+    for row in range(board.height):
+        for col in range(board.width):
+            arr[board.height - 1 - row][col] = values[board.columns[col][row]]
+    return arr
+
+
+def test_env_plays_like_the_board():
+    env = SelfPlayEnv(16, seed=0)
+    rng = np.random.RandomState(1)
+    boards = [ConnectFourBoard() for game in range(16)]
+    colors = ["R"] * 16
+    finished = 0
+    while finished < 100:
+        legal = env.legalMoves()
+        for game, board in enumerate(boards):
+            assert list(np.nonzero(legal[game])[0]) == board.getLegalMoves()
+            assert np.array_equal(env.boards[game], boardMatrix(board))
+        moves = np.array([rng.choice(board.getLegalMoves()) for board in boards])
+        winners, full = env.play(moves)
+        for game, board in enumerate(boards):
+            board.addPiece(moves[game], colors[game])
+            winner = board.getLastMoveWinner()
+            assert winners[game] == {None: 0, "R": 1, "B": -1}[winner]
+            assert full[game] == (winner is None and board.isFull())
+            colors[game] = "B" if colors[game] == "R" else "R"
+            if winner is not None or board.isFull():
+                boards[game] = ConnectFourBoard()
+                colors[game] = "R"
+                finished += 1
+        env.reset((winners != 0) | full)
+
+
+def test_child_vecs_are_the_boards_after_each_move():
+    env = SelfPlayEnv(4, seed=2)
+    for ply in range(10):
+        env.play(np.array([ply % 7, 3, (2 * ply) % 7, 0 if ply < 6 else 1]))
+    children = env.childVecs()
+    legal = env.legalMoves()
+    for game in range(4):
+        for col in range(7):
+            if not legal[game, col]:
+                assert np.array_equal(children[game, col], env.boardVecs()[game])
+                continue
+            child = env.boards[game].copy()
+            row = 5 - env.fillHeights[game, col]
+            child[row, col] = env.colors[game]
+            assert np.array_equal(children[game, col], child.reshape(42))
+
+
+def test_moves_are_legal_and_greedy_for_the_side_to_move():
+    env = SelfPlayEnv(2, seed=3)
+    for ply in range(6):
+        env.play(np.array([0, 6]))
+    env.play(np.array([1, 5]))  # black to move in both games, column 0 of game 0 and 6 of game 1 are full
+    values = np.array([[-5.0, 1, 2, 3, 4, 5, 6], [0, 1, 2, 3, 4, 5, -7.0]])
+    moves, chosen = env.chooseMoves(values)
+    assert list(moves) == [1, 0] and list(chosen) == [1, 0]
+    for i in range(50):
+        moves, chosen = env.chooseMoves(values, epsilon=1.0)
+        assert moves[0] != 0 and moves[1] != 6
+
+
+def test_step_scores_every_move_in_one_call():
+    env = SelfPlayEnv(8, seed=4)
+    calls = []
+
+    def evaluate(vecs):
+        calls.append(vecs.shape)
+        return vecs.sum(axis=1, keepdims=True)
+
+    values, winners, full = env.step(evaluate)
+    assert calls == [(8 * 7, 42)]
+    assert values.shape == winners.shape == full.shape == (8,)
+    assert np.all(env.fillHeights.sum(axis=1) == 1) and np.all(env.colors == -1)
+
+
+def test_td_examples_have_make_moves_targets():
+    env = SelfPlayEnv(16, seed=5)
+    evaluate = lambda vecs: np.full((len(vecs), 1), 2.0)
+    finished = 0
+    while finished < 20:
+        inputs, targets, winners, full = tdExamples(env, evaluate, 1.0, 0.5, onlyEnded=(finished < 10))
+        ended = (winners != 0) | full
+        assert len(inputs) == len(targets) == 5 * np.sum(ended) + (16 - np.sum(ended)) * (finished >= 10)
+        assert np.sum(targets == 10.0) == 5 * np.sum(winners > 0)
+        assert np.sum(targets == -12.0) == 5 * np.sum(winners < 0)
+        assert np.sum(targets == 1.0) == len(targets) - 5 * np.sum(ended)
+        assert np.all(env.fillHeights[ended] == 0)
+        finished += np.sum(ended)
+
+
+def test_game_results_count_wins_and_draws():
+    winners = np.array([1, 0, -1, 1, 0])
+    full = np.array([False, True, False, False, False])
+    assert gameResults(winners, full) == {"R": 2, "B": 1, "Draw": 1}
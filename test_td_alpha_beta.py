@@ -1,10 +1,10 @@
-import temporal_difference 
+import td_inference
 import agent 
 import connect_four 
 from player import HumanPlayer
 
 def playAgainstHuman(agentColor, humanColor, restorePath, depth):
-	tdLearner = temporal_difference.TemporalDifferenceLearner(color=agentColor, restorePath=restorePath)
+	tdLearner = td_inference.loadEvaluator(restorePath)
 	tdAlphaBetaAgent = agent.ConnectFourAgent(color=humanColor, depth=depth, algorithm="TDAlphaBeta", tdEvaluator=tdLearner)
 	human = HumanPlayer()
 
@@ -15,7 +15,7 @@ def playAgainstHuman(agentColor, humanColor, restorePath, depth):
 	game.play(display=True)
 
 def playAgainstMinimax(numGames, tdColor, minimaxColor, restorePath, depth):
-	tdLearner = temporal_difference.TemporalDifferenceLearner(color="R", restorePath=restorePath)
+	tdLearner = td_inference.loadEvaluator(restorePath)
 
 	results = {"R": [0, 0], "B": [0, 0], "Draw": [0, 0]}  # [numWins, numMoves]
 
@@ -0,0 +1,133 @@
+import os
+import random
+import shutil
+
+import numpy as np
+import pytest
+
+import td_inference
+from board import ConnectFourBoard
+
+CHECKPOINT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_ckpt400000")
+REFERENCE = CHECKPOINT + "_outputs.npy"
+
+
+def randomBoards(seed, count):
+    rng = random.Random(seed)
+    for i in range(count):
+        board = ConnectFourBoard()
+        color = "R"
+        for move in range(rng.randint(0, 30)):
+            board.addPiece(rng.choice(board.getLegalMoves()), color)
+            color = "B" if color == "R" else "R"
+            if board.getLastMoveWinner() is not None or board.isFull():
+                break
+        yield board, color
+
+
+def test_checkpoint_holds_the_network_and_its_adam_slots():
+    tensors = td_inference.readCheckpoint(CHECKPOINT)
+    shapes = {"W1": (42, 24), "b1": (24,), "W2": (24, 16), "b2": (16,),
+              "W3": (16, 8), "b3": (8,), "W4": (8, 1), "b4": (1,)}
+    for name, shape in shapes.items():
+        assert tensors[name].shape == shape and tensors[name].dtype == np.float32
+        assert tensors[name + "/Adam"].shape == shape
+    assert tensors["beta1_power"].shape == ()
+
+
+def test_checkpoint_is_converted_to_npz_once(tmp_path):
+    prefix = str(tmp_path / "model")
+    for suffix in (".index", ".data-00000-of-00001"):
+        shutil.copy(CHECKPOINT + suffix, prefix + suffix)
+    weights = td_inference.loadWeights(prefix)
+    assert os.path.exists(prefix + ".npz")
+    cached = td_inference.loadWeights(prefix)
+    for name in td_inference.WEIGHT_NAMES:
+        assert np.array_equal(weights[name], cached[name])
+        assert np.array_equal(td_inference.loadWeights(prefix + ".npz")[name], weights[name])
+
+
+def test_forward_evaluation_matches_the_reference_outputs():
+    # one row per board: its input vector, the three hidden layers and the network value,
+    # saved from the weights read out of model_ckpt400000
+    reference = np.load(REFERENCE)
+    vecs, hidden1, hidden2, hidden3, values = np.split(reference, [42, 66, 82, 90], axis=1)
+    evaluator = td_inference.TDInference(td_inference.checkpointWeights(CHECKPOINT))
+    w = evaluator.getWeights()
+    assert np.allclose(evaluator.forwardEvaluation(vecs), values, atol=1e-5)
+    # the checkpoint's third layer never activates, so the value alone says nothing about the first two
+    layer = np.maximum(vecs.dot(w["W1"]), 0) + w["b1"]
+    assert np.allclose(layer, hidden1, atol=1e-4)
+    layer = np.maximum(layer.dot(w["W2"]), 0) + w["b2"]
+    assert np.allclose(layer, hidden2, atol=1e-4)
+    layer = np.maximum(layer.dot(w["W3"]), 0) + w["b3"]
+    assert np.allclose(layer, hidden3, atol=1e-4)
+
+
+def test_checkpoint_checksums_catch_misread_tensors(tmp_path):
+    prefix = str(tmp_path / "model_ckpt400000")
+    for suffix in (".index", ".data-00000-of-00001"):
+        shutil.copy(CHECKPOINT + suffix, prefix + suffix)
+    with open(prefix + ".data-00000-of-00001", "r+b") as f:
+        f.seek(100)
+        f.write(b"\0\0\0\1")
+    with pytest.raises(ValueError, match="W1 "):
+        td_inference.readCheckpoint(prefix)
+
+
+def test_board_encoding():
+    evaluator = td_inference.TDInference(td_inference.checkpointWeights(CHECKPOINT))
+    board = ConnectFourBoard()
+    board.addPiece(2, "R")
+    board.addPiece(2, "B")
+    vec = evaluator.boardToVec(board)[0]
+    # row 0 is the bottom of the board and the last row of the input
+    assert vec[5 * 7 + 2] == 1 and vec[4 * 7 + 2] == -1 and np.count_nonzero(vec) == 2
+    children = evaluator.childVecs(board, board.getLegalMoves(), "R")
+    for move, child in zip(board.getLegalMoves(), children):
+        board.addPiece(move, "R")
+        assert np.array_equal(child, evaluator.boardToVec(board)[0])
+        board.undoMove()
+
+
+
+def test_incremental_search_matches_per_leaf_evaluation():
+    from td_alpha_beta import TDAlphaBeta
+    # random weights: the checkpoint's values are too close together for rounding not to reorder them
+    rng = np.random.RandomState(3)
+    weights = td_inference.checkpointWeights(CHECKPOINT)
+    network = td_inference.TDInference(dict(
+        (name, rng.randn(*np.shape(weights[name])).astype(np.float32)) for name in td_inference.WEIGHT_NAMES))
+    for board, color in randomBoards(2, 12):
+        if board.isEmpty() or board.isFull() or board.getLastMoveWinner() is not None:
+            continue
+        for depth in (1, 2, 3):
+            perLeaf, incremental = TDAlphaBeta(network, incremental=False), TDAlphaBeta(network)
+            random.seed(depth)
+            move = perLeaf.bestMove(depth, board, color)
+            random.seed(depth)
+            assert incremental.bestMove(depth, board, color) == move
+            assert incremental.nodes == perLeaf.nodes
+            # every node got the same value, up to float rounding, bound and best move
+            entries = sorted(entry for entry in perLeaf.transpositionTable.slots if entry is not None)
+            others = sorted(entry for entry in incremental.transpositionTable.slots if entry is not None)
+            assert len(others) == len(entries)
+            for entry, other in zip(entries, others):
+                assert abs(entry.value - other.value) < 1e-4 and entry._replace(value=0) == other._replace(value=0)
+
+
+
+def test_immediate_win_beats_slower_wins_from_the_table():
+    from td_alpha_beta import TDAlphaBeta
+    from transposition import TranspositionTable
+    board = ConnectFourBoard()
+    for move, color in ((1, "R"), (1, "B"), (2, "R"), (2, "B"), (3, "R"), (3, "B")):
+        board.addPiece(move, color)
+    # red wins at once in column 0 or 4, and two moves later after any other move
+    network = td_inference.TDInference(td_inference.checkpointWeights(CHECKPOINT))
+    for seed in range(20):
+        table = TranspositionTable(sizeMB=1)
+        TDAlphaBeta(network, table).bestMove(4, board, "R")
+        random.seed(seed)
+        # the shallower search finds the slower wins in the table, scored by the deeper one
+        assert TDAlphaBeta(network, table).bestMove(2, board, "R") in (0, 4)
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("tensorflow")
+
+from replay_buffer import ReplayBuffer
+from temporal_difference import TemporalDifferenceLearner
+
+
+class RecordedSteps(object):
+    """ Stands in for the learner's train op, keeping the minibatches it is run on """
+
+    def __init__(self):
+        self.feeds = []
+
+    def run(self, feed_dict):
+        self.feeds.append(feed_dict)
+
+
+@pytest.fixture(scope="module")
+def learner():
+    return TemporalDifferenceLearner(color="R")
+
+
+def test_replay_train_keeps_the_replay_ratio(learner):
+    learner.trainStep = RecordedSteps()
+    learner.samplesDue = 0.0
+    replay = ReplayBuffer(100, seed=0)
+    inputs, targets = np.ones((6, 42)), np.arange(6)
+    # nothing is sampled until the buffer holds a minibatch
+    assert learner._replayTrain(replay, inputs, targets, 8, 2.0) == 0 and learner.samplesDue == 0
+    assert learner._replayTrain(replay, inputs, targets, 8, 2.0) == 1 and learner.samplesDue == 4
+    assert learner._replayTrain(replay, inputs, targets, 8, 2.0) == 2 and learner.samplesDue == 0
+    assert len(replay) == 18 and len(learner.trainStep.feeds) == 3
+    for feed in learner.trainStep.feeds:
+        assert feed[learner.boardVec].shape == (8, 42) and feed[learner.target].shape == (8, 1)
+
+
+def test_add_results_tallies_finished_games(learner):
+    learner.results = {"R": 1, "B": 0, "Draw": 0}
+    assert learner._addResults({"R": 2, "B": 1, "Draw": 0}) == 3
+    assert learner._addResults({"R": 0, "B": 0, "Draw": 4}) == 4
+    assert learner.results == {"R": 3, "B": 1, "Draw": 4}
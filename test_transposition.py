@@ -0,0 +1,109 @@
+import random
+
+from board import ConnectFourBoard
+from minimax import Minimax
+from transposition import TranspositionTable, EXACT, LOWER, UPPER, boundType
+
+
+def randomPositions(seed, count, minMoves=0, maxMoves=20):
+    """ Yields (board, color to move) pairs reached by random play, none of them won yet """
+    rng = random.Random(seed)
+    while count > 0:
+        board = ConnectFourBoard()
+        color = "R"
+        for i in range(rng.randint(minMoves, maxMoves)):
+            board.addPiece(rng.choice(board.getLegalMoves()), color)
+            color = "B" if color == "R" else "R"
+            if board.getLastMoveWinner() is not None:
+                break
+        if board.containsFourInARow() is None and not board.isFull():
+            count -= 1
+            yield board, color
+
+
+class RootValues(Minimax):
+    """ Records the value of each root move, in the order bestMove searches them """
+
+    def bestMove(self, depth, board, curr_player, *args, **kwargs):
+        self.rootMoves = board.getNumMoves()
+        self.values = {}
+        return Minimax.bestMove(self, depth, board, curr_player, *args, **kwargs)
+
+    def record(self, board, value):
+        if board.getNumMoves() == self.rootMoves + 1:
+            self.values[board.getPrevMove()] = -value
+        return value
+
+    def search(self, depth, board, curr_player):
+        return self.record(board, Minimax.search(self, depth, board, curr_player))
+
+    def search_alpha_beta(self, depth, board, curr_player, a, b):
+        return self.record(board, Minimax.search_alpha_beta(self, depth, board, curr_player, a, b))
+
+
+class NoTable(TranspositionTable):
+    """ A table that never remembers anything """
+
+    def store(self, key, depth, value, bound, move=None):
+        pass
+
+
+def test_bound_types():
+    assert boundType(-5, -5, 5) == UPPER
+    assert boundType(5, -5, 5) == LOWER
+    assert boundType(0, -5, 5) == EXACT
+
+
+def test_probe_uses_bounds_of_deep_enough_entries():
+    table = TranspositionTable(sizeMB=1)
+    assert table.probe(1, 3, -10, 10) == (None, -10, 10, None)
+    table.store(1, 3, 4, EXACT, move=2)
+    assert table.probe(1, 3, -10, 10) == (4, -10, 10, 2)
+    assert table.probe(1, 4, -10, 10) == (None, -10, 10, 2)  # too shallow: only the move is used
+
+    table.store(2, 3, 4, LOWER, move=5)
+    assert table.probe(2, 2, -10, 10) == (None, 4, 10, 5)  # alpha raised to the lower bound
+    assert table.probe(2, 2, -10, 3) == (4, 4, 3, 5)  # bound at or above beta: cutoff
+    assert table.probe(2, 2, 6, 10) == (None, 6, 10, 5)
+
+    table.store(3, 3, -4, UPPER, move=0)
+    assert table.probe(3, 3, -10, 10) == (None, -10, -4, 0)  # beta lowered to the upper bound
+    assert table.probe(3, 3, -3, 10) == (-4, -3, -4, 0)  # bound at or below alpha: cutoff
+
+
+def test_lookup_checks_the_whole_key():
+    table = TranspositionTable(sizeMB=1)
+    table.store(7, 1, 1, EXACT)
+    assert table.lookup(7 + table.numSlots) is None
+    assert table.lookup(7).value == 1
+
+
+def test_depth_preferred_replacement_and_aging():
+    table = TranspositionTable(sizeMB=1)
+    other = 5 + table.numSlots  # same slot as key 5
+    table.store(5, 4, 1, EXACT)
+    table.store(other, 2, 2, EXACT)
+    assert table.lookup(5).value == 1 and table.lookup(other) is None  # the deeper entry stays
+    table.store(other, 4, 3, EXACT)
+    assert table.lookup(other).value == 3  # equal depth replaces
+    table.newSearch()
+    table.store(5, 1, 4, EXACT)
+    assert table.lookup(5).value == 4  # entries from an earlier search give way to any depth
+    table.store(other, 0, 5, EXACT)
+    assert table.lookup(5).value == 4  # but within a search depth still wins
+
+    always = TranspositionTable(sizeMB=1, replacement="always")
+    always.store(5, 4, 1, EXACT)
+    always.store(5 + always.numSlots, 0, 2, EXACT)
+    assert always.lookup(5) is None
+
+
+def test_search_results_do_not_depend_on_the_table():
+    shared = TranspositionTable(sizeMB=1)
+    for board, color in randomPositions(seed=21, count=10, minMoves=2, maxMoves=12):
+        engines = [RootValues("simple"), RootValues("simple", NoTable(sizeMB=0)),
+                   RootValues("simple", TranspositionTable(sizeMB=1)), RootValues("simple", shared)]
+        engines[0].bestMove(4, board, color)
+        for engine in engines[1:]:
+            engine.bestMove(4, board, color, True)
+            assert engine.values == engines[0].values
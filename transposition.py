@@ -0,0 +1,89 @@
+"""
+Bounded transposition table shared by the Minimax and TDAlphaBeta search engines.
+
+Connect Four reaches the same position through many move orders, so the engines
+remember what they have already searched, keyed by the board's Zobrist hash
+(ConnectFourBoard.getHashKey). Each entry records the searched depth, the value,
+whether that value is exact or only a bound, and the best move found.
+"""
+from collections import namedtuple
+
+# Bound types
+EXACT = 0
+LOWER = 1  # the search failed high: the true value is at least the stored value
+UPPER = 2  # the search failed low: the true value is at most the stored value
+
+Entry = namedtuple("Entry", ["key", "depth", "value", "bound", "move", "age"])
+
+# Rough CPython footprint of one filled slot: the slot pointer, the Entry tuple,
+# the 64-bit key and a float value. Used to turn a memory cap into a slot count.
+BYTES_PER_ENTRY = 200
+
+
+def boundType(value, alphaOrig, beta):
+    """Classifies the result of a fail-soft alpha-beta search over the window (alphaOrig, beta)."""
+    if value <= alphaOrig:
+        return UPPER
+    if value >= beta:
+        return LOWER
+    return EXACT
+
+
+class TranspositionTable(object):
+    """
+    Fixed-size hash table of search results. A key lives in slot key % numSlots,
+    so the table never grows past its memory cap; when two keys collide the
+    replacement policy decides which entry survives:
+
+        "depth"   keep the deeper search, unless the stored entry is left over
+                  from an earlier search (see newSearch)
+        "always"  the newest entry always wins
+    """
+
+    def __init__(self, sizeMB=16, replacement="depth"):
+        if replacement not in ("depth", "always"):
+            raise ValueError("Unrecognized replacement policy: %s" % replacement)
+        self.numSlots = max(1, int(sizeMB * 2 ** 20) // BYTES_PER_ENTRY)
+        self.replacement = replacement
+        self.slots = [None] * self.numSlots
+        self.age = 0
+
+    def newSearch(self):
+        """Marks every stored entry as belonging to an earlier search, so it may be replaced freely."""
+        self.age += 1
+
+    def clear(self):
+        self.slots = [None] * self.numSlots
+
+    def lookup(self, key):
+        """Returns the Entry stored for key, or None."""
+        entry = self.slots[key % self.numSlots]
+        if entry is not None and entry.key == key:
+            return entry
+        return None
+
+    def probe(self, key, depth, a, b):
+        """ Looks key up for a node searched to 'depth' with window (a, b)
+            Returns (value, a, b, move): value is not None when the stored result
+            settles the node outright, otherwise a and b are narrowed by any usable
+            bound, and move is the stored best move (or None) for move ordering
+        """
+        entry = self.lookup(key)
+        if entry is None:
+            return None, a, b, None
+        if entry.depth >= depth:
+            if entry.bound == EXACT:
+                return entry.value, a, b, entry.move
+            elif entry.bound == LOWER:
+                a = max(a, entry.value)
+            else:
+                b = min(b, entry.value)
+            if a >= b:
+                return entry.value, a, b, entry.move
+        return None, a, b, entry.move
+
+    def store(self, key, depth, value, bound, move=None):
+        index = key % self.numSlots
+        old = self.slots[index]
+        if old is None or self.replacement == "always" or old.age != self.age or depth >= old.depth:
+            self.slots[index] = Entry(key, depth, value, bound, move, self.age)